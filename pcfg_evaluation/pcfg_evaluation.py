@@ -52,6 +52,12 @@ def build_arg_parse():
         type=int,
         default=4,
         help='Specify number of folds.')
+    parser.add_argument(
+        '--fold-workers',
+        dest='fold_workers',
+        type=int,
+        default=1,
+        help='Specify number of folds processed in parallel.')
     return parser
 
 
@@ -61,6 +67,7 @@ def make_config(args):
     with open(args.config_path, 'r') as handle:
         config = json.load(handle)
     config['folds'] = args.folds
+    config['fold_workers'] = args.fold_workers
     config['verbose'] = args.verbose
     config['default_config']['verbose'] = args.verbose
     config['lexicon_config']['verbose'] = args.verbose
@@ -90,6 +97,7 @@ def print_header(config):
     print 'Corpus: {}'.format(config['filesystem']['full_corpus'])
     print 'Annotation schemes: {}'.format(get_schemes(config))
     print 'Folds: {}'.format(config['folds'])
+    print 'Fold workers: {}'.format(config['fold_workers'])
     print
 
 
@@ -7,11 +7,11 @@
 # purpose: Extract a bitpar compatible grammar from corpus.
 ######################################################
 
-import sys
 import argparse
 
 from progress.bar import Bar
-from pyparsing import nestedExpr
+
+from pipeline.tree_io import tree_string_to_list
 
 
 def build_arg_parse():
@@ -47,17 +47,6 @@ def make_config(args):
         }
 
 
-def tree_string_to_list(tree):
-    '''Parse tree string to list.'''
-    parse_input = '({})'.format(tree)
-    try:
-        out = nestedExpr().parseString(parse_input).asList()[0][0]
-    except:
-        print tree
-        sys.exit()
-    return out
-
-
 def write_grammar(
         (unary_rules, binary_rules, total_count),
         out_file,
@@ -224,7 +213,7 @@ def extract_grammar(input_file, verbose=False):
 
 def extract_grammar_from_list(train_trees, verbose=False):
     ''' Extract dict with lhs to (rhs, count) mapping
-        of the grammar rules.
+        of the grammar rules from (id, tree list) pairs.
 
         { "lhs" : {
             "rhs1": "rule_count",
@@ -252,8 +241,6 @@ def extract_grammar_from_list(train_trees, verbose=False):
         bar = Bar('Generate PCFG\t\t', max=len(train_trees))
     # for every tree
     for (tree_id, tree) in train_trees:
-        # get tree
-        tree = tree_string_to_list(tree)
         # extract rules and their count from trees
         grammar = count_rules(tree, tree_id, grammar)
         if verbose:
@@ -263,6 +250,48 @@ def extract_grammar_from_list(train_trees, verbose=False):
     return grammar
 
 
+def merge_grammars(grammars):
+    '''Sum the rule and lhs counts of several grammars.'''
+    merged = ({}, {}, {})
+    for grammar in grammars:
+        # unary and binary rules
+        for (rules, merged_rules) in zip(grammar[:2], merged[:2]):
+            for (lhs, rhs_dict) in rules.iteritems():
+                merged_rhs_dict = merged_rules.setdefault(lhs, {})
+                for (rhs, count) in rhs_dict.iteritems():
+                    merged_rhs_dict[rhs] = merged_rhs_dict.get(rhs, 0) + count
+        for (lhs, count) in grammar[2].iteritems():
+            merged[2][lhs] = merged[2].get(lhs, 0) + count
+    return merged
+
+
+def subtract_grammar(grammar, held_out):
+    ''' Subtract the counts of "held_out", a grammar of a
+        part of the trees of "grammar", from "grammar". Rules
+        that are only used in the held out trees are removed,
+        so the result equals the grammar of the other trees.
+        "grammar" is not changed.'''
+    result = tuple(dict(counts) for counts in grammar)
+    # unary and binary rules
+    for (rules, held_out_rules) in zip(result[:2], held_out[:2]):
+        for (lhs, held_out_rhs_dict) in held_out_rules.iteritems():
+            rhs_dict = dict(rules[lhs])
+            for (rhs, count) in held_out_rhs_dict.iteritems():
+                rhs_dict[rhs] -= count
+                if not rhs_dict[rhs]:
+                    del rhs_dict[rhs]
+            if rhs_dict:
+                rules[lhs] = rhs_dict
+            else:
+                del rules[lhs]
+    total_count = result[2]
+    for (lhs, count) in held_out[2].iteritems():
+        total_count[lhs] -= count
+        if not total_count[lhs]:
+            del total_count[lhs]
+    return result
+
+
 def make_grammar_helper(config):
     '''Make a grammar from a tree corpus.'''
     # extract grammar from input file
@@ -279,6 +308,12 @@ def make_grammar_from_list_helper(train_trees, config):
     write_grammar(grammar, config['output'])
 
 
+def make_grammar_from_counts_helper(grammar, held_out, config):
+    ''' Make the grammar of a tree corpus without the held
+        out trees from the grammar of all trees.'''
+    write_grammar(subtract_grammar(grammar, held_out), config['output'])
+
+
 def make_grammar():
     '''Make a grammar from a tree corpus.'''
     arg_parser = build_arg_parse()
@@ -7,11 +7,11 @@
 # purpose: Extract a bitpar compatible lexicon from corpus.
 ######################################################
 
-import sys
 import argparse
 
 from progress.bar import Bar
-from pyparsing import nestedExpr
+
+from pipeline.tree_io import tree_string_to_list
 
 
 def build_arg_parse():
@@ -47,17 +47,6 @@ def make_config(args):
         }
 
 
-def tree_string_to_list(tree):
-    '''Parse tree string to list.'''
-    parse_input = '({})'.format(tree)
-    try:
-        out = nestedExpr().parseString(parse_input).asList()[0][0]
-    except:
-        print tree
-        sys.exit()
-    return out
-
-
 def cat_dict_to_str(cat_dict):
     '''Transform a dict of tuples:
 
@@ -89,8 +78,7 @@ def write_lex(lex, out_file, to_screen=False):
 
 def unary(tree, tree_id):
     '''Process unary terminal tree.'''
-    head = tree.pop(0)
-    rest = tree[0]
+    [head, rest] = tree
     # found word
     if type(rest) == str:
         return [(rest, head)]
@@ -179,7 +167,8 @@ def extract_lexicon(input_file, verbose=False):
 
 def extract_lexicon_from_list(full_corpus, verbose=False):
     ''' Extract dict with word to word_category
-        and word occurence mapping from tree.
+        and word occurence mapping from (id, tree list)
+        pairs.
 
         { "word1" : {
             "cat_name1": "cat_cardinality",
@@ -193,7 +182,6 @@ def extract_lexicon_from_list(full_corpus, verbose=False):
     if verbose:
         bar = Bar('Generate bitpar lexicon\t', max=len(full_corpus))
     for (tree_id, tree) in full_corpus:
-        tree = tree_string_to_list(tree)
         # extract words from leafes of the tree
         words = extract_words(tree, tree_id)
         # count word occurences
@@ -101,6 +101,9 @@ def parse_list(input_file, cmd, verbose=False):
     if verbose:
         num_lines = sum(1 for line in open(input_file))
         bar = Bar('Parse test corpus\t', max=num_lines)
+    # bitpar input needs to be in specific format
+    # and has to be from a file next to the input
+    temp_file = '{}.tmp'.format(input_file)
     with open(input_file, 'r') as f:
         # for every tree
         for line in f:
@@ -109,9 +112,6 @@ def parse_list(input_file, cmd, verbose=False):
             line = line.strip()
             # split line into morphs
             compound = line.split(' ')
-            # bitpar input needs to be in specific format
-            # and has to be from a file
-            temp_file = "temp.txt"
             # generate file with input
             open(temp_file, "w").writelines(
                 '{}\n\n'.format('\n'.join(compound)))
@@ -123,7 +123,8 @@ def parse_list(input_file, cmd, verbose=False):
             bar.finish()
         f.close()
         # remove temporary file
-        os.remove(temp_file)
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
     return trees
 
 
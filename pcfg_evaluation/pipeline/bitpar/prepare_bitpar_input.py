@@ -7,11 +7,11 @@
 # purpose: Prepare word input to fit bitpar input format.
 ######################################################
 
-import sys
 import argparse
 
 from progress.bar import Bar
-from pyparsing import nestedExpr
+
+from pipeline.tree_io import tree_string_to_list
 
 
 def build_arg_parse():
@@ -47,17 +47,6 @@ def make_config(args):
         }
 
 
-def tree_string_to_list(tree):
-    '''Parse tree string to list.'''
-    parse_input = '({})'.format(tree)
-    try:
-        out = nestedExpr().parseString(parse_input).asList()[0][0]
-    except:
-        print tree
-        sys.exit()
-    return out
-
-
 def write_word_list(word_list, out_file, to_screen=False):
     '''Write lexicon to file.'''
     if to_screen:
@@ -153,7 +142,7 @@ def extract_word_list(input_file, verbose=False):
 
 def extract_word_list_from_list(bitpar_input, verbose=False):
     ''' Extract splitted list of compound words
-        from the tree in the input file.
+        from (id, tree list) pairs.
 
         [
          [parts, of, word, one],
@@ -165,7 +154,6 @@ def extract_word_list_from_list(bitpar_input, verbose=False):
     if verbose:
         bar = Bar('Prepare bitpar input\t', max=len(bitpar_input))
     for (tree_id, tree) in bitpar_input:
-        tree = tree_string_to_list(tree)
         # add word to word list
         word_list.append(extract_word(tree, tree_id))
         if verbose:
@@ -9,11 +9,11 @@
 # list of unary terminal trees.
 ######################################################
 
-import sys
 import argparse
 
 from progress.bar import Bar
-from pyparsing import nestedExpr
+
+from pipeline.tree_io import tree_string_to_list, tree_list_to_string
 
 ROOT = 'root'
 
@@ -83,28 +83,6 @@ def make_config(args):
         }
 
 
-def tree_string_to_list(tree):
-    '''Parse tree string to list.'''
-    parse_input = '({})'.format(tree)
-    try:
-        out = nestedExpr().parseString(parse_input).asList()[0][0]
-    except:
-        print tree
-        sys.exit()
-    return out
-
-
-def tree_list_to_string(tree):
-    '''Parse tree list to bracketed string.'''
-    # base case not nested tree
-    temp_ls = []
-    for elem in tree:
-        temp_ls.append(
-            tree_list_to_string(
-                elem)) if type(elem) == list else temp_ls.append(elem)
-    return '({})'.format(' '.join(temp_ls))
-
-
 def cat_dict_to_str(cat_dict):
     '''Transform a dict of tuples:
 
@@ -210,27 +188,29 @@ def binary(tree, parent, config, tree_id):
         return ([], '')
 
 
+def annotate_tree(tree_ls, tree_id, config):
+    ''' Annotate a tree list with top, parent, head and lexem.
+        The given tree list is not changed.'''
+    if config['top']:
+        # perform top annotation
+        tree_ls = add_top_node(tree_ls, tree_id)
+    if config['parent'] or config['lex'] or config['head']:
+        # perform parent, head and lex annotation
+        (tree_ls, _, _) = binary(tree_ls, 'root', config, tree_id)
+    return tree_ls
+
+
 def annotate_list(full_corpus, config, proc_msg='process', root=ROOT):
-    ''' Annotate the trees with top, parent of head and
-        lexicalize the trees.'''
+    ''' Annotate the (id, tree list) pairs with top, parent of
+        head and lexicalize the trees. Return (id, annotated
+        tree list) pairs.'''
     anno_full_corpus = []
-    # for every line in input
+    # for every tree
     if config['verbose']:
         bar = Bar(proc_msg, max=len(full_corpus))
-    for (tree_id, tree) in full_corpus:
-        # cast tree to list
-        tree_ls = tree_string_to_list(tree)
-        # get tree id for error reports
-        if config['top']:
-            # perform top annotation
-            tree_ls = add_top_node(tree_ls, tree_id)
-        if config['parent'] or config['lex'] or config['head']:
-            # perform parent, head and lex annotation
-            (tree_ls, _, _) = binary(tree_ls, 'root', config, tree_id)
-        # cast tree list to string
-        tree = tree_list_to_string(tree_ls)
-        # put tree back into row
-        anno_full_corpus.append((tree_id, tree))
+    for (tree_id, tree_ls) in full_corpus:
+        anno_full_corpus.append(
+            (tree_id, annotate_tree(tree_ls, tree_id, config)))
         if config['verbose']:
             bar.next()
     if config['verbose']:
@@ -258,12 +238,7 @@ def annotate_helper(config, root=ROOT):
             tree_ls = tree_string_to_list(column[-1])
             # get tree id for error reports
             tree_id = column[0]
-            if config['top']:
-                # perform top annotation
-                tree_ls = add_top_node(tree_ls, tree_id)
-            if config['parent'] or config['lex'] or config['head']:
-                # perform parent, head and lex annotation
-                (tree_ls, _, _) = binary(tree_ls, 'root', config, tree_id)
+            tree_ls = annotate_tree(tree_ls, tree_id, config)
             # cast tree list to string
             tree_str = tree_list_to_string(tree_ls)
             # put tree back into row
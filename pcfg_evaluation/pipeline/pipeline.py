@@ -1,14 +1,23 @@
 #!/usr/bin/python
 
+import os
+import sys
+import copy
 import subprocess
 
 from progress.bar import Bar
 from sklearn.model_selection import KFold
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 
+import tree_io
 from pcfg import annotate
 from bitpar import lexicon, prepare_bitpar_input, grammar, parse_list
 
+# corpora and rule counts the forked fold workers inherit from the
+# main process
+SHARED = {}
+
 
 def preprocess(config):
     ''' Prepare data structures:
@@ -17,7 +26,8 @@ def preprocess(config):
         y: trees
         compound_card: word cardinality of
             compound words
-        full_corpus: rows of full corpus
+        full_corpus: (id, tree list) pairs of the full corpus,
+            every tree is parsed here once
 
     '''
     corpora = {
@@ -41,7 +51,8 @@ def preprocess(config):
             corpora['x'].append((column[0], column[3]))
             # cast tree to list of (id, tree) pairs
             corpora['y'].append((column[0], column[-1]))
-            corpora['full_corpus'].append((column[0], column[-1]))
+            corpora['full_corpus'].append(
+                (column[0], tree_io.tree_string_to_list(column[-1])))
             # count number of subwords in compound
             card = column[3].count('#') + 1
             corpora['compound_card'].append(card)
@@ -53,18 +64,30 @@ def preprocess(config):
     corpora['x'] = np.array(corpora['x'])
     corpora['y'] = np.array(corpora['y'])
     corpora['compound_card'] = np.array(corpora['compound_card'])
+    corpora['full_corpus'] = tree_array(corpora['full_corpus'])
     return corpora
 
 
+def tree_array(pairs):
+    ''' Store (id, tree list) pairs in a one dimensional
+        array, so folds can be sliced by index like "y".'''
+    trees = np.empty(len(pairs), dtype=object)
+    for (idx, pair) in enumerate(pairs):
+        trees[idx] = pair
+    return trees
+
+
 def preprocess_helper(config):
-    '''Initiate preprocessing of the corpora.'''
+    ''' Initiate preprocessing of the corpora. The full corpus
+        is annotated once, folds take their annotated train
+        and test trees from "anno_full_corpus" by index.'''
     # five_error = []
     # process base corpora
     corpora = preprocess(config)
     # annotate corpora
-    corpora['anno_full_corpus'] = annotate.annotate_list(
+    corpora['anno_full_corpus'] = tree_array(annotate.annotate_list(
         corpora['full_corpus'], config['default_config'],
-        'Annotate corpus\t\t')
+        'Annotate corpus\t\t'))
     # make lexicon
     lexicon.make_lexicon_from_list_helper(
         corpora['anno_full_corpus'],
@@ -101,6 +124,16 @@ def filename_list_helper(buf, config):
     config['gold_output_path'] = files['gold']
     config['cleaned_prediction'] = files['cleaned_prediction']
     config['analysis'] = files['analysis']
+    # configs without a fold log entry log next to the gold file
+    config['fold_log'] = files.get('fold_log', files['gold'] + '.log')
+
+
+def fold_config(config, buf):
+    ''' Copy the config and set the file names of fold "buf",
+        so folds never share a config dict or a file.'''
+    config = copy.deepcopy(config)
+    filename_list_helper(buf, config)
+    return config
 
 
 def write_gold_file(config, fold_corpora):
@@ -111,33 +144,20 @@ def write_gold_file(config, fold_corpora):
     f.close()
 
 
-def preprocess_fold(corpora, train_idx, test_idx, config, buf):
+def preprocess_fold(corpora, test_idx, config):
     '''Preprocess data necessary for processing a fold:
 
-        1. generate file names
-        2. train corpus
-        3. bitpar input
-        4. gold standard corpus
-        5. annotate train/ test corpus
+        1. annotated bitpar input
+        2. gold standard corpus
 
+        "config" holds the file names of the fold.
     '''
     fold_corpora = {}
-    # generate filnames
-    filename_list_helper(buf, config)
-    # generate corpora
-    fold_corpora['train_trees'] = corpora['y'][train_idx]
-    fold_corpora['bitpar_input'] = corpora['y'][test_idx]
+    # slice the annotated corpus
+    fold_corpora['anno_bitpar_input'] = corpora['anno_full_corpus'][test_idx]
     if config['make_gold']:
         fold_corpora['gold'] = corpora['y'][test_idx]
         write_gold_file(config, fold_corpora)
-    fold_corpora['anno_train_trees'] = annotate.annotate_list(
-        fold_corpora['train_trees'],
-        config['default_config'],
-        'Annotate train corpus\t')
-    fold_corpora['anno_bitpar_input'] = annotate.annotate_list(
-        fold_corpora['bitpar_input'],
-        config['default_config'],
-        'Annotate test corpus\t')
     return fold_corpora
 
 
@@ -183,41 +203,123 @@ def evaluate(config):
     ana_file.close()
 
 
+def count_fold_rules(anno_trees, folds, verbose=False):
+    ''' Count the rules of the annotated test trees of every
+        (test_idx, buf) fold once. Return the grammar of all
+        trees, the sum of the counts, and a dict of fold
+        number -> grammar of its test trees. The grammar of
+        a fold is the sum minus the counts of its test trees.'''
+    test_grammars = {}
+    if verbose:
+        bar = Bar('Count PCFG rules\t', max=len(folds))
+    for (test_idx, buf) in folds:
+        test_grammars[buf] = grammar.extract_grammar_from_list(
+            anno_trees[test_idx])
+        if verbose:
+            bar.next()
+    if verbose:
+        bar.finish()
+    return (grammar.merge_grammars(test_grammars.values()), test_grammars)
+
+
+def run_fold(
+        corpora, (full_grammar, test_grammars), test_idx, config, buf):
+    ''' Process a fold with the fold config "config" and the
+        rule counts of "count_fold_rules".'''
+    if config['verbose']:
+        print '\nMake {}. fold'.format(buf)
+    fold_corpora = preprocess_fold(corpora, test_idx, config)
+    # generate PCFG of the train trees from the rule counts
+    grammar.make_grammar_from_counts_helper(
+        full_grammar, test_grammars[buf], config['grammar_config'])
+    # prepare bitpar input
+    prepare_bitpar_input.make_input_from_list_helper(
+        fold_corpora['anno_bitpar_input'],
+        config['bitpar_input_prepare_config'])
+    # parse test corpus with bitpar
+    parse_list.run_helper(config['bitpar_input_config'])
+    # clean predictions from bitpar specific symbols
+    clean_predictions(config)
+    # generate evalb evaluation
+    evaluate(config)
+    if config['verbose']:
+        print 'Done with fold {}'.format(buf)
+    return buf
+
+
+def run_fold_worker((test_idx, buf), config):
+    ''' Process a fold in a worker process on the shared
+        corpora and rule counts. Output and progress bars go
+        to the fold log.'''
+    config = fold_config(config, buf)
+    # progress bars keep their own reference to stderr, so the
+    # file descriptors of the worker are pointed to the log
+    saved = [os.dup(1), os.dup(2)]
+    with open(config['fold_log'], 'w') as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            run_fold(
+                SHARED['corpora'], SHARED['rule_counts'], test_idx,
+                config, buf)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            for fd in saved:
+                os.close(fd)
+    return (buf, config['fold_log'])
+
+
+def run_folds_parallel(corpora, rule_counts, folds, config):
+    ''' Process the (test_idx, buf) folds in "fold_workers"
+        processes. The workers are forked after the corpora
+        and rule counts are shared, so only the indices are
+        sent to them.'''
+    SHARED['corpora'] = corpora
+    SHARED['rule_counts'] = rule_counts
+    executor = ProcessPoolExecutor(max_workers=config['fold_workers'])
+    try:
+        futures = [
+            executor.submit(run_fold_worker, fold, config)
+            for fold in folds]
+        for future in as_completed(futures):
+            (buf, log) = future.result()
+            if config['verbose']:
+                print 'Done with fold {} (log: {})'.format(buf, log)
+    finally:
+        executor.shutdown()
+        SHARED.clear()
+
+
 def pipeline(config):
     '''Process pipeline that:
 
         1. preprocesses corpora
         2. runs kfold on corpora that
-            3. prepare gold, train, test trees
-            4. generate PCFG
+            3. prepare gold, test trees
+            4. generate PCFG by subtracting the rule
+               counts of the test trees
             5. parse test corpus
             6. evaluate results
 
+        With "fold_workers" above 1 the folds run in parallel
+        and write their output to per fold logs.
     '''
     # 1. preprocesses corpora
     corpora = preprocess_helper(config)
     # 2. run kfold on corpora that
-    buf = 1
     kf = KFold(n_splits=config['folds'])
-    for train_idx, test_idx in kf.split(corpora['x']):
-        if config['verbose']:
-            print '\nMake {}. fold'.format(buf)
-        fold_corpora = preprocess_fold(
-            corpora, train_idx, test_idx, config, buf)
-        # generate PCFG
-        grammar.make_grammar_from_list_helper(
-            fold_corpora['anno_train_trees'], config['grammar_config'])
-        # prepare bitpar input
-        prepare_bitpar_input.make_input_from_list_helper(
-            fold_corpora['anno_bitpar_input'],
-            config['bitpar_input_prepare_config'])
-        # parse test corpus with bitpar
-        parse_list.run_helper(config['bitpar_input_config'])
-        # clean predictions from bitpar specific symbols
-        clean_predictions(config)
-        # generate evalb evaluation
-        evaluate(config)
-        if config['verbose']:
-            print 'Done with fold {}'.format(buf)
-        # raise fold buffer
-        buf += 1
+    # the train trees of a fold are all other trees
+    folds = [
+        (test_idx, buf) for (buf, (_, test_idx))
+        in enumerate(kf.split(corpora['x']), 1)]
+    rule_counts = count_fold_rules(
+        corpora['anno_full_corpus'], folds, config['verbose'])
+    if config.get('fold_workers', 1) > 1:
+        run_folds_parallel(corpora, rule_counts, folds, config)
+        return
+    for (test_idx, buf) in folds:
+        run_fold(
+            corpora, rule_counts, test_idx, fold_config(config, buf), buf)
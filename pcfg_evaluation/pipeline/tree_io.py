@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+'''Define file encoding.'''
+#######################################################
+# name: tree_io.py
+# purpose: Read bracketed tree strings into nested lists
+# and write them back. Shared by annotation, lexicon,
+# grammar and bitpar input extraction. Run it to check
+# the round trip over a tree corpus and to compare its
+# speed with pyparsing "nestedExpr".
+######################################################
+
+import re
+import sys
+import time
+import argparse
+
+DEFAULT_IN = '../corpora/trees/compoundtree_dlexdb_format.corpus'
+# brackets and the labels or words between them
+TOKEN_RE = re.compile(r'[()]|[^\s()]+')
+
+
+class TreeException(Exception):
+    pass
+
+
+def string_to_list(tree):
+    ''' Build the nested list of a bracketed tree string in
+        one pass over its tokens:
+
+        "(noun (nbase Haus))" -> ['noun', ['nbase', 'Haus']]
+
+        Like "nestedExpr" the first tree of the string is
+        returned and a string without brackets is returned
+        unchanged.
+    '''
+    stack = [[]]
+    for token in TOKEN_RE.findall(tree):
+        if token == '(':
+            node = []
+            stack[-1].append(node)
+            stack.append(node)
+        elif token == ')':
+            if len(stack) == 1:
+                raise TreeException('Unbalanced tree: {}'.format(tree))
+            stack.pop()
+        else:
+            stack[-1].append(token)
+    if len(stack) != 1 or not stack[0]:
+        raise TreeException('Unbalanced tree: {}'.format(tree))
+    return stack[0][0]
+
+
+def tree_string_to_list(tree):
+    '''Parse tree string to list.'''
+    try:
+        return string_to_list(tree)
+    except TreeException:
+        print tree
+        sys.exit()
+
+
+def tree_list_to_string(tree):
+    '''Parse tree list to bracketed string.'''
+    parts = ['(']
+    # iterators of the open lists
+    stack = [iter(tree)]
+    space = False
+    while stack:
+        for elem in stack[-1]:
+            if space:
+                parts.append(' ')
+            if type(elem) == list:
+                parts.append('(')
+                stack.append(iter(elem))
+                space = False
+                break
+            parts.append(elem)
+            space = True
+        else:
+            stack.pop()
+            parts.append(')')
+            space = True
+    return ''.join(parts)
+
+
+def iter_trees(path):
+    '''Yield (id, tree string) of every row of a tree corpus.'''
+    with open(path, 'r') as f:
+        for line in f:
+            column = line.strip().split('\t')
+            yield (column[0], column[-1])
+
+
+def nested_expr_to_list(tree):
+    '''Parse tree string to list with pyparsing.'''
+    from pyparsing import nestedExpr
+    parse_input = '({})'.format(tree)
+    return nestedExpr().parseString(parse_input).asList()[0][0]
+
+
+def build_arg_parse():
+    '''Build a command line parser.'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--input',
+        dest='input',
+        type=str,
+        default=DEFAULT_IN,
+        help='Location of the tree corpus.')
+    parser.add_argument(
+        '--no-pyparsing',
+        dest='no_pyparsing',
+        action='store_true',
+        default=False,
+        help="Don't compare with pyparsing nestedExpr.")
+    return parser
+
+
+def run():
+    ''' Check that every tree of the corpus is written back
+        unchanged and read like "nestedExpr" reads it.'''
+    arg_parser = build_arg_parse()
+    args = arg_parser.parse_args()
+    trees = list(iter_trees(args.input))
+    start = time.time()
+    tree_lists = [string_to_list(tree) for (_, tree) in trees]
+    read_seconds = time.time() - start
+    start = time.time()
+    tree_strings = [tree_list_to_string(tree) for tree in tree_lists]
+    write_seconds = time.time() - start
+    mismatches = 0
+    for ((tree_id, tree), tree_string) in zip(trees, tree_strings):
+        if tree_string != tree:
+            mismatches += 1
+            print 'Round trip mismatch in tree {}'.format(tree_id)
+    print '{} trees, {} round trip mismatches'.format(len(trees), mismatches)
+    print 'Read: {:.3f}s, write: {:.3f}s'.format(read_seconds, write_seconds)
+    if args.no_pyparsing:
+        if mismatches:
+            sys.exit(1)
+        return
+    start = time.time()
+    expected = [nested_expr_to_list(tree) for (_, tree) in trees]
+    pyparsing_seconds = time.time() - start
+    differences = sum(
+        1 for (tree, tree_list) in zip(expected, tree_lists)
+        if tree != tree_list)
+    print 'nestedExpr: {:.3f}s, {} different lists, {:.0f}x slower'.format(
+        pyparsing_seconds, differences,
+        pyparsing_seconds / read_seconds if read_seconds else 0.0)
+    if mismatches or differences:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,16 @@
+#!/bin/bash
+# file: check.sh
+# equivalence checks, stop with an error on the first failing one
+set -e
+
+# lexer and pyparsing grammar agree on the segment corpus, also with
+# whitespace inside the compounds (about two minutes)
+cd ../segmentation_parser/segmentation_parser/
+python grammar/lexer.py
+cd ../../script/
+
+# bracketed trees are written back unchanged and read like pyparsing
+# nestedExpr reads them (about 20s)
+cd ../pcfg_evaluation/
+python -m pipeline.tree_io
+cd ../script/
@@ -4,7 +4,9 @@
 # for seg_parser
 find ../corpora/dot/ -name *.dot -print0 | xargs -0 rm -f
 find ../corpora/dot/ -name *.png -print0 | xargs -0 rm -f
+rm -f ../corpora/dot/manifest_*.tsv
 rm ../corpora/trees/seg_parser.out
+rm -f ../corpora/segments/*.lines
 
 # for compoundtree pipelinie
 rm ../corpora/bitpar/*.bitpar
@@ -3,7 +3,7 @@
 
 cd ../segmentation_parser/segmentation_parser/
 python parser.py --verbose --dot
+# render .png graph pictures of the dot files in corpora/dot/ on all cores,
+# pictures that are up to date are skipped
+python render.py --verbose
 cd ../../script/
-
-echo
-echo Please go to the folder "corpora/dot" and perform \"dot -Tpng *.dot -O\" to generate .png graph pictures of the dot files in corpora/dot/. We won\'t do it now because it might take a while.
@@ -0,0 +1 @@
+from .segmentation_parser import parse_many, ParseResult
@@ -0,0 +1 @@
+from .parser import parse_many, ParseResult
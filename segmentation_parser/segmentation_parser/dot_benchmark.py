@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+'''Define file encoding.'''
+#######################################################
+# name: dot_benchmark.py
+# purpose: Compare the dot emitter of "dot_write" to the
+# former recursive emitter on pyparsing tree lists.
+# Checks that both write the same graphs and times them.
+######################################################
+
+import sys
+import time
+import argparse
+import cStringIO
+import itertools
+
+from pyparsing import nestedExpr
+
+import dot_write
+import tools
+import tree_generator
+import grammar.lexer as lexer
+
+DEFAULT_IN = '../../corpora/segments/compound_cleaned_random.txt'
+
+
+# ---------- Former Emitter -------------------------
+
+
+def tree_string_to_list(tree):
+    '''Parse tree string to list.'''
+    parse_input = '({})'.format(tree)
+    return nestedExpr().parseString(parse_input).asList()[0]
+
+
+def write_node_definition(out_file, node_label, node_idx):
+    '''Write node definition by associating
+       the node label with a uniq index.'''
+    node_idx += 1
+    out_file.write('\t{} [label="{}"];\n'.format(node_idx, node_label))
+    return node_idx
+
+
+def write_transition(out_file, parent_idx, child_idx):
+    '''Write a transition'''
+    out_file.write('\t{}->{};\n'.format(parent_idx, child_idx))
+
+
+def rekursive_dot_write(out_file, parent_idx, children, node_idx):
+    ''' Translate the levels of the tree
+        to dot format in a rekursive way.'''
+    if type(children) is list and children:
+        child = children.pop(0)
+        node_idx = write_node_definition(
+            out_file,
+            child,
+            node_idx)
+        child_idx = node_idx
+        write_transition(out_file, parent_idx, node_idx)
+        for grand_child in children:
+            node_idx = rekursive_dot_write(
+                out_file,
+                child_idx,
+                grand_child,
+                node_idx)
+        return node_idx
+    if type(children) is str:
+        node_idx = write_node_definition(
+            out_file,
+            children,
+            node_idx)
+        write_transition(out_file, parent_idx, node_idx)
+        return node_idx
+    else:
+        print 'Empty or odd list while generationg dot file.'
+        return node_idx
+    return node_idx
+
+
+def rekursive_dot_write_init(out_file, tree_as_list):
+    '''Prepare tree list for rekursive translation
+       of tree levels to dot format.'''
+    node_idx = -1
+    if len(tree_as_list) > 1:
+        # iterate list 2-tuple wise to catch
+        # parent children combinations
+        parent = tree_as_list.pop(0)
+        # get dot reference for parent node
+        parent_idx = write_node_definition(
+            out_file,
+            parent,
+            node_idx)
+        node_idx = parent_idx
+        for child in tree_as_list:
+            # write children
+            node_idx = rekursive_dot_write(
+                out_file,
+                parent_idx,
+                child,
+                node_idx)
+    # in case tree consists of a single root note
+    else:
+        print 'Empty or odd list while generationg dot file.'
+        sys.exit()
+
+
+def legacy_graph_string(tree):
+    '''Translate a tree string the former way.'''
+    out_file = cStringIO.StringIO()
+    # write graph definition
+    out_file.write('digraph G {\n')
+    # tree string to list
+    tree_as_list = tree_string_to_list(
+        tree.replace(',', ''))
+    # write dot definition body
+    rekursive_dot_write_init(out_file, tree_as_list[0])
+    out_file.write('}')
+    return out_file.getvalue()
+
+
+# ---------- Benchmark ------------------------------
+
+
+def build_arg_parse():
+    '''Build a command line parser.'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--in',
+        dest='input',
+        type=str,
+        default=DEFAULT_IN,
+        help='specify file holding the input')
+    parser.add_argument(
+        '--limit',
+        dest='limit',
+        type=int,
+        default=2000,
+        help='set number of compound nouns to translate')
+    parser.add_argument(
+        '--repeat',
+        dest='repeat',
+        type=int,
+        default=3,
+        help='set number of timing runs, the best one counts')
+    return parser
+
+
+def load_trees(path, limit):
+    '''Generate the tree nodes of the first "limit" compound nouns.'''
+    trees = []
+    comp_nouns = itertools.islice(tools.iter_from_file(path), limit)
+    for (_, comp_noun) in comp_nouns:
+        try:
+            subtrees = tree_generator.prepare_subtrees(
+                lexer.parse_string(comp_noun))
+        except lexer.LexerException:
+            continue
+        trees.extend(tree_generator.iter_trees(subtrees))
+    return trees
+
+
+def best_time(func, trees, repeat):
+    '''Best time of "repeat" runs of "func" over all trees.'''
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        for tree in trees:
+            func(tree)
+        seconds = time.time() - start
+        if best is None or seconds < best:
+            best = seconds
+    return best
+
+
+def run():
+    '''Check and time the dot emitters.'''
+    arg_parser = build_arg_parse()
+    args = arg_parser.parse_args()
+    trees = load_trees(args.input, args.limit)
+    strings = [tree_generator.treetostring(tree) for tree in trees]
+    mismatches = 0
+    for (tree, string) in zip(trees, strings):
+        expected = legacy_graph_string(string)
+        if dot_write.graph_string(tree) != expected or \
+                dot_write.graph_string(string) != expected:
+            print 'Mismatch for tree: {}'.format(string)
+            mismatches += 1
+    print 'Compared {} trees, {} mismatches'.format(len(trees), mismatches)
+    timings = [
+        ('former emitter on tree strings', legacy_graph_string, strings),
+        # the parser hands tree strings to the emitter
+        ('emitter on tree strings (parser)',
+         dot_write.graph_string, strings),
+        ('emitter on tree nodes (benchmark)',
+         dot_write.graph_string, trees),
+    ]
+    for (name, func, items) in timings:
+        seconds = best_time(func, items, args.repeat)
+        print '{:<34} {:8.3f}s {:10.0f} trees/s'.format(
+            name, seconds, len(items) / seconds if seconds else 0.0)
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    run()
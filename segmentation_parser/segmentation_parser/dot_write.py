@@ -1,127 +1,262 @@
 # -*- coding: utf-8 -*-
 '''Define file encoding.'''
 
+import os
 import sys
-from progress.bar import Bar
-
-import grammar.grammar as grammar
-
-
-def write_node_definition(out_file, node_label, node_idx):
-    '''Write node definition by associating
-       the node label with a uniq index.'''
-    node_idx += 1
-    out_file.write('\t{} [label="{}"];\n'.format(node_idx, node_label))
-    return node_idx
-
-
-def write_terminal_definition(out_file, parent, terminal, node_idx):
-    '''Write node definition by associating
-       the node label with a uniq index.'''
-    parent_idx = node_idx + 1
-    out_file.write('\t{} [label="{}"];\n'.format(parent_idx, parent))
-    terminal_idx = parent_idx + 1
-    out_file.write('\t{} [label="{}"];\n'.format(terminal_idx, terminal))
-    return (terminal_idx, parent_idx, terminal_idx)
-
-
-def write_node(out_file, node_idx):
-    '''Write a terminal node.'''
-    out_file.write('\t{};\n'.format(node_idx))
-
-
-def write_transition(out_file, parent_idx, child_idx):
-    '''Write a transition'''
-    out_file.write('\t{}->{};\n'.format(parent_idx, child_idx))
-
-
-def rekursive_dot_write(out_file, parent_idx, children, node_idx):
-    ''' Translate the levels of the tree
-        to dot format in a rekursive way.'''
-    if type(children) is list and children:
-        child = children.pop(0)
-        node_idx = write_node_definition(
-            out_file,
-            child,
-            node_idx)
-        child_idx = node_idx
-        write_transition(out_file, parent_idx, node_idx)
-        for grand_child in children:
-            node_idx = rekursive_dot_write(
-                out_file,
-                child_idx,
-                grand_child,
-                node_idx)
-        return node_idx
-    if type(children) is str:
-        node_idx = write_node_definition(
-            out_file,
-            children,
-            node_idx)
-        write_transition(out_file, parent_idx, node_idx)
-        return node_idx
-    else:
-        print 'Empty or odd list while generationg dot file.'
-        return node_idx
-    return node_idx
-
-
-def rekursive_dot_write_init(out_file, tree_as_list):
-    '''Prepare tree list for rekursive translation
-       of tree levels to dot format.'''
-    node_idx = -1
-    if len(tree_as_list) > 1:
-        # iterate list 2-tuple wise to catch
-        # parent children combinations
-        parent = tree_as_list.pop(0)
-        # get dot reference for parent node
-        parent_idx = write_node_definition(
-            out_file,
-            parent,
-            node_idx)
-        node_idx = parent_idx
-        for child in tree_as_list:
-            # write children
-            node_idx = rekursive_dot_write(
-                out_file,
-                parent_idx,
-                child,
-                node_idx)
-    # in case tree consists of a single root note
-    else:
-        print 'Empty or odd list while generationg dot file.'
-        sys.exit()
-
-
-def write_dot_file_helper((idx, name, tree_list), dot_dir):
-    '''Write a dot version of the tree to file.'''
-    if tree_list:
-        # iterate over tree version while enumerating them
+import hashlib
+import argparse
+
+import tools
+import tree_generator
+
+DOT_DIR = '../../corpora/dot/'
+# batched output: graphs are appended to shard files that
+# are listed with the byte offset of every graph in the index
+SHARD_NAME = 'graphs_{:04d}.dot'
+INDEX_NAME = 'graphs.index'
+# bytes per shard file
+SHARD_SIZE = 64 * 1024 * 1024
+# compound nouns per graph generation task
+CHUNK_SIZE = 100
+# dot files: id, file name and tree hash of every graph written
+# for an input file or a shard of it
+MANIFEST_NAME = 'manifest_{}.tsv'
+
+
+def tree_children(tree):
+    '''Children of a tree node, unary nodes have an empty lhs.'''
+    if tree.lhs == '':
+        return (tree.rhs,)
+    return (tree.lhs, tree.rhs)
+
+
+def graph_string(tree):
+    ''' Translate a tree to a dot graph definition.
+
+        "tree" is a tree node of "tree_generator" or a bracketed
+        tree string. The parser always passes tree strings,
+        they are turned into nodes by "string_to_tree" first.
+        Nodes are numbered in pre-order, each node is defined
+        right before the transition from its parent. The tree
+        is walked once with an explicit stack and the graph is
+        joined into one string.
+    '''
+    if type(tree) is str:
+        tree = tree_generator.string_to_tree(tree)
+    lines = ['digraph G {\n']
+    if type(tree) is str:
+        # single node, like the tree of a compound that failed
+        lines.append('\t0 [label="{}"];\n'.format(tree.replace(',', '')))
+        lines.append('}')
+        return ''.join(lines)
+    # commas are dropped from labels like earlier versions did
+    lines.append('\t0 [label="{}"];\n'.format(tree.root.replace(',', '')))
+    node_idx = 0
+    # (node, parent index), rightmost child at the bottom
+    stack = [(child, 0) for child in reversed(tree_children(tree))]
+    while stack:
+        (node, parent_idx) = stack.pop()
+        node_idx += 1
+        if type(node) is str:
+            label = node
+        else:
+            label = node.root
+            stack.extend(
+                (child, node_idx) for child in reversed(tree_children(node)))
+        lines.append('\t{} [label="{}"];\n\t{}->{};\n'.format(
+            node_idx, label.replace(',', ''), parent_idx, node_idx))
+    lines.append('}')
+    return ''.join(lines)
+
+
+def graph_chunk(chunk):
+    ''' Translate the trees of a list of (idx, name, tree list)
+        tuples to lists of dot graph definitions.'''
+    return [
+        [graph_string(tree) for tree in tree_list]
+        for (idx, name, tree_list) in chunk]
+
+
+def graph_version():
+    '''Hash the source of the dot emitter.'''
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(module_dir, 'dot_write.py'), 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def manifest_name(input_path, shard=None):
+    ''' File name of the manifest of the dot files of an input
+        file or of shard (i, N) of it.'''
+    name = os.path.basename(input_path)
+    if shard:
+        name += '.{}-{}'.format(*shard)
+    return MANIFEST_NAME.format(name)
+
+
+def read_manifest(path):
+    ''' Read the manifest of earlier written dot files.
+        Return (emitter version, dict of id -> (file name, tree hash)).
+    '''
+    entries = {}
+    version = None
+    if not os.path.exists(path):
+        return (version, entries)
+    with open(path, 'r') as manifest:
+        for line in manifest:
+            if line.startswith('#'):
+                version = line.split()[-1]
+                continue
+            (graph_id, filename, digest) = line.rstrip('\n').split('\t')
+            entries[graph_id] = (filename, digest)
+    return (version, entries)
+
+
+def remove_stale(dot_dir, filenames):
+    ''' Remove the dot files "filenames" and the images
+        rendered next to them like "name.dot.png".'''
+    if not filenames:
+        return
+    for name in os.listdir(dot_dir):
+        if name in filenames or name.rsplit('.', 1)[0] in filenames:
+            os.remove(os.path.join(dot_dir, name))
+
+
+def write_each(
+        items, dot_dir, manifest, stats=None, rewrite=False):
+    ''' Write dot files for every item while passing the items on.
+
+        The manifest file "manifest" in "dot_dir" keeps the
+        hash of the tree of every dot file of the run. Only
+        graphs whose tree or file name changed since the last
+        run with the same manifest are written unless "rewrite"
+        is set. Dot files of graphs that are gone are removed,
+        files of other manifests are left alone. Written,
+        unchanged and removed files are counted in "stats".
+    '''
+    if stats is None:
+        stats = {}
+    for key in ('dot_written', 'dot_unchanged', 'dot_removed'):
+        stats.setdefault(key, 0)
+    version = graph_version()
+    manifest_path = dot_dir + manifest
+    (old_version, old_entries) = read_manifest(manifest_path)
+    if rewrite or old_version != version:
+        # every file is written, but stale files are still known
+        old_entries = dict(
+            (graph_id, (filename, None))
+            for (graph_id, (filename, _)) in old_entries.iteritems())
+    stale = set()
+    manifest_file = open(manifest_path + '.tmp', 'w')
+    manifest_file.write('# version {}\n'.format(version))
+    for (idx, name, tree_list) in items:
         for (tree_idx, tree) in enumerate(tree_list, 1):
-            # assemble file name
-            filename = '{}{}{}_{}.dot'.format(
-                dot_dir, str(idx), '_{}'.format(str(tree_idx)), name)
-            # prepare file
-            out_file = open(filename, 'w')
-            # write graph definition to file
-            out_file.write('digraph G {\n')
-            # tree string to list
-            tree_as_list = grammar.tree_string_to_list(
-                tree.replace(',', ''))
-            # write dot definition body
-            rekursive_dot_write_init(out_file, tree_as_list[0])
-            out_file.write('}')
-            out_file.close()
-
-
-def write(items, dot_dir, verbose):
-    '''Wrapper function.'''
-    if verbose:
-        bar = Bar('Generating dot files\t', max=len(items))
-    for elem in items:
-        write_dot_file_helper(elem, dot_dir)
-        if verbose:
-            bar.next()
-    if verbose:
-        bar.finish()
-        print 'Writing dot files to {}'.format(dot_dir)
+            graph_id = '{}_{}'.format(idx, tree_idx)
+            filename = '{}_{}.dot'.format(graph_id, name)
+            digest = hashlib.md5(tree).hexdigest()
+            old_entry = old_entries.pop(graph_id, None)
+            if old_entry == (filename, digest):
+                stats['dot_unchanged'] += 1
+            else:
+                if old_entry is not None and old_entry[0] != filename:
+                    stale.add(old_entry[0])
+                with open(dot_dir + filename, 'w') as out_file:
+                    out_file.write(graph_string(tree))
+                stats['dot_written'] += 1
+            manifest_file.write(
+                '{}\t{}\t{}\n'.format(graph_id, filename, digest))
+        yield (idx, name, tree_list)
+    manifest_file.close()
+    # graphs of the last run that are gone now
+    stale.update(filename for (filename, _) in old_entries.itervalues())
+    remove_stale(dot_dir, stale)
+    stats['dot_removed'] += len(stale)
+    os.rename(manifest_path + '.tmp', manifest_path)
+
+
+def write_batched(
+        items, dot_dir, executor, max_pending,
+        chunk_size=CHUNK_SIZE, shard_size=SHARD_SIZE):
+    ''' Write the dot graphs of every item into shard files
+        of about "shard_size" bytes while passing the items on.
+
+        The graphs are generated in the "executor" pool in
+        chunks of "chunk_size" items, at most "max_pending"
+        chunks at once. Every graph is listed in the index
+        file with its id, name, shard file, offset and length.
+    '''
+    shard_no = 0
+    shard = open(dot_dir + SHARD_NAME.format(shard_no), 'wb')
+    index = open(dot_dir + INDEX_NAME, 'w')
+    offset = 0
+    for (chunk, graph_lists) in tools.bounded_map(
+            executor, graph_chunk, tools.chunks(items, chunk_size),
+            max_pending):
+        for ((idx, name, tree_list), graphs) in zip(chunk, graph_lists):
+            for (tree_idx, graph) in enumerate(graphs, 1):
+                if offset >= shard_size:
+                    shard.close()
+                    shard_no += 1
+                    shard = open(dot_dir + SHARD_NAME.format(shard_no), 'wb')
+                    offset = 0
+                # graphs are separated by a new line
+                shard.write(graph + '\n')
+                index.write('{}_{}\t{}\t{}\t{}\t{}\n'.format(
+                    idx, tree_idx, name, SHARD_NAME.format(shard_no),
+                    offset, len(graph)))
+                offset += len(graph) + 1
+            yield (idx, name, tree_list)
+    shard.close()
+    index.close()
+
+
+def read_index(dot_dir):
+    ''' Read the index of batched dot output.
+        Return dict of id -> (name, shard file, offset, length).'''
+    entries = {}
+    with open(dot_dir + INDEX_NAME, 'r') as index:
+        for line in index:
+            (graph_id, name, shard, offset, length) = \
+                line.rstrip('\n').split('\t')
+            entries[graph_id] = (name, shard, int(offset), int(length))
+    return entries
+
+
+def read_graph(dot_dir, (name, shard, offset, length)):
+    '''Read a single graph of batched dot output.'''
+    with open(os.path.join(dot_dir, shard), 'rb') as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+def build_arg_parse():
+    '''Build a command line parser.'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--dot-dir',
+        dest='dot_dir',
+        type=str,
+        default=DOT_DIR,
+        help='set batched dot output path')
+    parser.add_argument(
+        'graph_ids',
+        nargs='+',
+        help='ids like "12_3" of the graphs to print')
+    return parser
+
+
+def run():
+    '''Print graphs from batched dot output.'''
+    arg_parser = build_arg_parse()
+    args = arg_parser.parse_args()
+    # the index is read once for all ids
+    entries = read_index(args.dot_dir)
+    for graph_id in args.graph_ids:
+        entry = entries.get(graph_id)
+        if entry is None:
+            print 'No graph with id {}'.format(graph_id)
+            sys.exit(1)
+        print read_graph(args.dot_dir, entry)
+
+
+if __name__ == '__main__':
+    run()
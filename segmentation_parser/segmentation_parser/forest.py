@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+'''Define file encoding.'''
+#######################################################
+# name: forest.py
+# purpose: Packed forest output of the parser. Instead
+# of a row per tree a compound gets a single row with
+# the subtrees between its "#" marks and the number of
+# bracketings of them, which expands to the tree rows.
+######################################################
+
+import argparse
+
+import tools
+import tree_generator
+
+DEFAULT_IN = '../../corpora/trees/seg_parser.forest'
+DEFAULT_OUT = '../../corpora/trees/seg_parser.out'
+
+
+def write_packed(pairs, out_file):
+    ''' Write a row per compound noun of:
+
+        - id
+        - compound noun without split markers
+        - weight
+        - analyzed compound noun
+        - number of trees
+        - subtrees (one column each)
+
+        The trees are the first bracketings of the subtrees
+        in the order of "tree_generator.iter_bracketings".
+    '''
+    out_file = open(out_file, 'w')
+    for (idx, compound_noun, tree_list) in pairs:
+        (num_trees, leaves) = tree_generator.pack_trees(tree_list)
+        out_file.write('{}\t{}\t{}\t{}\t{}\t{}\n'.format(
+            str(idx),
+            tools.unsplit_compound(compound_noun),
+            '<0.0>',
+            compound_noun,
+            str(num_trees),
+            '\t'.join(leaves)))
+    out_file.close()
+
+
+def iter_packed(path):
+    ''' Lazily read a packed forest file.
+        Yield (id, compound noun, tree list) tuples.'''
+    with open(path, 'r') as f:
+        for line in f:
+            row = line.rstrip('\n').split('\t')
+            (idx, _, _, compound_noun, num_trees) = row[:5]
+            yield (idx, compound_noun, tree_generator.unpack_trees(
+                int(num_trees), row[5:]))
+
+
+def build_arg_parse():
+    '''Build a command line parser.'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--in',
+        dest='input',
+        type=str,
+        default=DEFAULT_IN,
+        help='specify file holding the packed forests')
+    parser.add_argument(
+        '--out',
+        dest='output',
+        type=str,
+        default=DEFAULT_OUT,
+        help='specify file holding the tree rows')
+    return parser
+
+
+def run():
+    '''Expand a packed forest file into tree rows.'''
+    arg_parser = build_arg_parse()
+    args = arg_parser.parse_args()
+    tools.write_results(iter_packed(args.input), args.output)
+
+
+if __name__ == '__main__':
+    run()
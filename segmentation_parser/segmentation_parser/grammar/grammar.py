@@ -5,7 +5,6 @@
 # ---------- PYPARSING GRAMMAR ---------------
 # --------------------------------------------
 import pyparsing as pp
-from pyparsing import nestedExpr
 
 
 class BadParseException(Exception):
@@ -14,6 +13,10 @@ class BadParseException(Exception):
 
 # ---------- Parse Action Definitions --------
 
+# Parse actions return unary terminal trees as (base, word)
+# tuples. Segments with suffixes or links return a list of
+# tuples that pyparsing flattens into the compound result.
+
 
 def list_to_string(result):
     '''Transform a list of string to a string.'''
@@ -30,12 +33,6 @@ def normalise_parser_output(result_list):
     return norm_list
 
 
-def tree_string_to_list(tree):
-    '''Parse tree string to list.'''
-    parse_input = '({})'.format(tree)
-    return nestedExpr().parseString(parse_input).asList()[0]
-
-
 def oops(s, loc, expr, err):
     '''Action to take if parser fails.
 
@@ -53,16 +50,15 @@ def parse_final_stem(result):
 
         [ 'final stem', 'suffix'*]
 
-        to bracket structure:
+        to tree structure:
 
         ('nbase' 'stem') ... (Optional suffixes)
     '''
-    if len(result) > 1:
-        # rename suffix type
-        suffix_str = ' '.join(result[1:])
-        suffix_str = suffix_str.replace('SUFFIX', 'NSUFFIX')
-        return '(nbase {}) {}'.format(result[0], suffix_str)
-    return '(nbase {})'.format(result[0])
+    # rename suffix type
+    suffixes = [
+        (base.replace('SUFFIX', 'NSUFFIX'), word)
+        for (base, word) in result[1:]]
+    return [('nbase', result[0])] + suffixes
 
 
 def parse_final_type_stem(result):
@@ -70,7 +66,7 @@ def parse_final_type_stem(result):
 
         [ 'final stem', '<', 'type', '>', 'suffix'*]
 
-        to bracket structure:
+        to tree structure:
 
         ('nbase' 'stem') ... (Optional suffixes)
     '''
@@ -78,17 +74,11 @@ def parse_final_type_stem(result):
     stype = result[2]
     if len(result) > 4:
         # rename suffix type
-        suffix_str = ' '.join(result[4:])
-        suffix_str = suffix_str.replace(
-            '(SUFFIX',
-            '(NSUFFIX')
-        return '({0}base {1}) {2}'.format(
-            stype.lower(),
-            stem,
-            suffix_str)
-    return '(nbase {1})'.format(
-            stype.lower(),
-            stem)
+        suffixes = [
+            ('NSUFFIX' if base == 'SUFFIX' else base, word)
+            for (base, word) in result[4:]]
+        return [(stype.lower() + 'base', stem)] + suffixes
+    return [('nbase', stem)]
 
 
 def parse_stem_suffix(result):
@@ -101,14 +91,7 @@ def parse_stem_suffix(result):
         ('stem' 'typeSUFFIX') ... (Optional suffixes)
     '''
     stem = result[0]
-    if len(result) > 1:
-        # rename suffix type
-        suffix_str = ' '.join(result[1:])
-        return '(nbase {0}) {1}'.format(
-            stem,
-            suffix_str)
-    return '(nbase {0})'.format(
-            stem)
+    return [('nbase', stem)] + list(result[1:])
 
 
 def parse_stem_type_suffix(result):
@@ -122,16 +105,7 @@ def parse_stem_type_suffix(result):
     '''
     stem = result[0]
     stype = result[2]
-    if len(result) > 4:
-        # rename suffix type
-        suffix_str = ' '.join(result[4:])
-        return '({0}base {1}) {2}'.format(
-            stype.lower(),
-            stem,
-            suffix_str)
-    return '({0}base {1})'.format(
-            stype.lower(),
-            stem)
+    return [(stype.lower() + 'base', stem)] + list(result[4:])
 
 
 def parse_single_stem(result):
@@ -183,9 +157,7 @@ def parse_stem_type(result):
     '''
     stype = result[2]
     stem = result[0]
-    return '({0}base {1})'.format(
-            stype.lower(),
-            stem)
+    return (stype.lower() + 'base', stem)
 
 
 def parse_particle(result):
@@ -199,8 +171,7 @@ def parse_particle(result):
 
     '''
     particle_stem = result[0]
-    return '(PARTICLE {})'.format(
-            particle_stem)
+    return ('PARTICLE', particle_stem)
 
 
 def parse_prefix(result):
@@ -214,8 +185,7 @@ def parse_prefix(result):
 
     '''
     prefix_stem = result[0]
-    return '({0} {0})'.format(
-            prefix_stem)
+    return (prefix_stem, prefix_stem)
 
 
 def parse_verb_prefix_mark(result):
@@ -242,8 +212,7 @@ def parse_link(result):
 
     '''
     link_stem = (result[0]).replace('\\', '')
-    return '(link_{0} {0})'.format(
-            link_stem)
+    return ('link_' + link_stem, link_stem)
 
 
 def parse_link_stem_type(result):
@@ -287,14 +256,11 @@ def parse_suffix_type(result):
     suffix_stem = result[1]
     suffix_type = result[3]
     if suffix_type == 'Part':
-        return '(PARTICLE {0})'.format(
-                suffix_stem)
+        return ('PARTICLE', suffix_stem)
     elif suffix_type == 'n':
-        return '(NSUFFIX {0})'.format(
-                suffix_stem)
+        return ('NSUFFIX', suffix_stem)
     else:
-        return '(SUFFIX {0})'.format(
-                suffix_stem)
+        return ('SUFFIX', suffix_stem)
 
 
 def parse_part_type(result):
@@ -308,8 +274,7 @@ def parse_part_type(result):
 
     '''
     suffix_stem = result[1]
-    return '(PARTICLE {0})'.format(
-            suffix_stem)
+    return ('PARTICLE', suffix_stem)
 
 
 def parse_suffix_term(result):
@@ -322,7 +287,7 @@ def parse_suffix_term(result):
         ('SUFFIX' 'stem')
     '''
     suffix_stem = result[0]
-    return '(SUFFIX {0})'.format(suffix_stem)
+    return ('SUFFIX', suffix_stem)
 
 
 # ---------- Parsers ----------------------------------
@@ -334,7 +299,8 @@ STEM_TYPES = ['NAME', 'N', 'GEO', 'EGO', 'A', 'ORG', 'X', 'LOC', 'PRO', 'EVE',
 
 # Terminal Parsers
 
-stem_term = pp.Word(pp.alphas + '=' + '+' + '-' + '|' + 'ÄäÜüÖößéèâê')
+stem_term = pp.Word(
+    pp.alphas + '=' + '+' + '-' + '|' + 'ÄäÜüÖößéèâê')
 stem_types = pp.Or(STEM_TYPES)
 verb_mark = pp.Word('V')
 verb_prefix_type = pp.Word('prt')
@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+'''Define file encoding.'''
+#######################################################
+# name: lexer.py
+# purpose: Hand written single pass lexer for segmented
+# compound nouns. Produces the same list of (base, word)
+# unary terminal trees as "grammar.compound.parseString"
+# without trying every pyparsing alternative per morph.
+######################################################
+
+import os
+import re
+import sys
+import argparse
+
+DEFAULT_IN = '../../corpora/segments/compound_cleaned_random.txt'
+
+
+class LexerException(Exception):
+    pass
+
+
+# ---------- Character Classes ----------------------
+
+# same character sets as the terminal parsers in grammar.py
+ALPHAS = 'A-Za-z'
+UMLAUTS = 'ÄäÜüÖöß'
+ACCENTS = 'éèâê'
+
+STEM_RE = re.compile('[{}=+\\-|{}{}]+'.format(
+    ALPHAS, re.escape(UMLAUTS), re.escape(ACCENTS)))
+LINK_RE = re.compile('[{}{}\\\\]+'.format(ALPHAS, re.escape(UMLAUTS)))
+SUFFIX_RE = re.compile('[{}{}]+'.format(ALPHAS, re.escape(UMLAUTS)))
+SUFFIX_TYPE_RE = re.compile('[aNVnZzvIAkXPart]+')
+PREFIX_TYPE_RE = re.compile('p+')
+PARTICLE_TYPE_RE = re.compile('[prt]+')
+LINK_TYPE_RE = re.compile('l+')
+SUFFIX_MARK_RE = re.compile('~+')
+OPEN_RE = re.compile('<+')
+CLOSE_RE = re.compile('>+')
+HASH_RE = re.compile('#+')
+PRIOR_RE = re.compile('@+')
+VERB_PREFIX_RE = re.compile('=+')
+# whitespace pyparsing skips before every terminal
+WHITE_RE = re.compile('[ \t\r\n]*')
+# a bare link term also ignores backslashes in front of it
+LINK_WHITE_RE = re.compile('[ \t\r\n\\\\]*')
+
+# longest literal first, like "pp.Or(STEM_TYPES)"
+STEM_TYPES = sorted(
+    ['NAME', 'N', 'GEO', 'EGO', 'A', 'ORG', 'X', 'LOC', 'PRO', 'EVE',
+     'Z', 'z', 'FM', 'K', 'k', 'ADV', 'n', 'Part', 'f', 'V'],
+    key=len, reverse=True)
+
+# kinds of morph segments in order of the "compound" alternatives
+FINAL_STEM = 0
+FINAL_TYPE_STEM = 1
+STEM_TYPE_SUFFIX = 2
+STEM_SUFFIX = 3
+PRIOR = 4
+HASH = 5
+PREFIX = 6
+PARTICLE = 7
+VERB_PREFIX = 8
+
+
+# ---------- Terminal Scanners ----------------------
+
+
+def skip_white(comp, pos, regex=WHITE_RE):
+    '''Return position after the whitespace at "pos".'''
+    return regex.match(comp, pos).end()
+
+
+def scan(regex, comp, pos):
+    '''Return end of the match of "regex" at "pos" or -1.'''
+    match = regex.match(comp, pos)
+    if match:
+        return match.end()
+    return -1
+
+
+def scan_stem_type(comp, pos):
+    '''Match one of the stem type literals at "pos".'''
+    for stype in STEM_TYPES:
+        if comp.startswith(stype, pos):
+            return pos + len(stype)
+    return -1
+
+
+def scan_bracket(comp, pos, scan_type):
+    ''' Match a type bracket like "<N>" at "pos".
+
+        Return (end, type) or (-1, None).
+    '''
+    pos = scan(OPEN_RE, comp, skip_white(comp, pos))
+    if pos < 0:
+        return (-1, None)
+    pos = skip_white(comp, pos)
+    end = scan_type(comp, pos)
+    if end < 0:
+        return (-1, None)
+    stype = comp[pos:end]
+    end = scan(CLOSE_RE, comp, skip_white(comp, end))
+    if end < 0:
+        return (-1, None)
+    return (end, stype)
+
+
+def scan_stem_bracket(comp, pos):
+    '''Match a stem type bracket like "<N>" at "pos".'''
+    return scan_bracket(comp, pos, scan_stem_type)
+
+
+def scan_regex_bracket(regex):
+    '''Make a bracket type scanner from a regex.'''
+    return lambda comp, pos: scan(regex, comp, pos)
+
+
+scan_suffix_type = scan_regex_bracket(SUFFIX_TYPE_RE)
+scan_prefix_type = scan_regex_bracket(PREFIX_TYPE_RE)
+scan_particle_type = scan_regex_bracket(PARTICLE_TYPE_RE)
+scan_link_type = scan_regex_bracket(LINK_TYPE_RE)
+
+
+# ---------- Morph Scanners -------------------------
+
+
+def suffix_type_term(suffix_stem, suffix_type):
+    '''Same output as "grammar.parse_suffix_type".'''
+    if suffix_type == 'Part':
+        return ('PARTICLE', suffix_stem)
+    elif suffix_type == 'n':
+        return ('NSUFFIX', suffix_stem)
+    return ('SUFFIX', suffix_stem)
+
+
+def scan_suffix(comp, pos):
+    ''' Match "~suffix<type>" or "~suffix" at "pos".
+
+        Return (end, unary terminal tree) or (-1, None).
+    '''
+    stem_start = scan(SUFFIX_MARK_RE, comp, pos)
+    if stem_start < 0:
+        return (-1, None)
+    stem_start = skip_white(comp, stem_start)
+    stem_end = scan(SUFFIX_RE, comp, stem_start)
+    if stem_end < 0:
+        return (-1, None)
+    suffix_stem = comp[stem_start:stem_end]
+    (end, suffix_type) = scan_bracket(comp, stem_end, scan_suffix_type)
+    if end < 0:
+        return (stem_end, ('SUFFIX', suffix_stem))
+    return (end, suffix_type_term(suffix_stem, suffix_type))
+
+
+def scan_link(comp, pos):
+    ''' Match "\\link<l>" or "\\link" at "pos".
+
+        Like the ignore expression of "grammar.link_term"
+        a bare link skips backslashes and needs more than
+        them, while "\\<l>" still counts as (empty) typed
+        link. The longer match wins, the typed link on a tie.
+    '''
+    start = skip_white(comp, pos)
+    link_end = scan(LINK_RE, comp, start)
+    end = -1
+    if link_end >= 0:
+        (end, _) = scan_bracket(comp, link_end, scan_link_type)
+    bare_start = skip_white(comp, pos, LINK_WHITE_RE)
+    bare_end = scan(LINK_RE, comp, bare_start)
+    if bare_end > end:
+        (start, link_end, end) = (bare_start, bare_end, bare_end)
+    if end < 0:
+        return (-1, None)
+    link_stem = comp[start:link_end].replace('\\', '')
+    return (end, ('link_' + link_stem, link_stem))
+
+
+def scan_morphs(comp, pos, with_links):
+    ''' Match zero or more suffixes (and links if "with_links")
+        starting at "pos".
+
+        Return (end, list of unary terminal trees).
+    '''
+    terms = []
+    length = len(comp)
+    while pos < length:
+        start = skip_white(comp, pos)
+        if start == length:
+            break
+        if comp[start] == '~':
+            (end, term) = scan_suffix(comp, start)
+        elif with_links:
+            (end, term) = scan_link(comp, pos)
+        else:
+            break
+        if end < 0:
+            break
+        terms.append(term)
+        pos = end
+    return (pos, terms)
+
+
+# ---------- Segment Scanner ------------------------
+
+
+def scan_segment(comp, pos):
+    ''' Match the longest morph segment at "pos" with the same
+        priorities as the "^" alternatives of "grammar.compound".
+
+        Return (end, kind, payload) or (-1, None, None).
+    '''
+    length = len(comp)
+    best = (-1, None, None)
+    pos = skip_white(comp, pos)
+    stem_end = scan(STEM_RE, comp, pos)
+    if stem_end >= 0:
+        stem = comp[pos:stem_end]
+        # stem followed by suffixes and links up to the end
+        (end, terms) = scan_morphs(comp, stem_end, True)
+        if skip_white(comp, end) == length:
+            best = (length, FINAL_STEM, (stem, terms))
+        # typed stem followed by suffixes and links
+        (type_end, stype) = scan_stem_bracket(comp, stem_end)
+        if type_end > 0:
+            (end, terms) = scan_morphs(comp, type_end, True)
+            if skip_white(comp, end) == length:
+                kind = FINAL_TYPE_STEM
+                end = length
+            else:
+                kind = STEM_TYPE_SUFFIX
+            if end > best[0]:
+                best = (end, kind, (stem, stype, terms))
+        # stem followed by suffixes
+        (end, terms) = scan_morphs(comp, stem_end, False)
+        if end > best[0]:
+            best = (end, STEM_SUFFIX, (stem, terms))
+    end = scan(PRIOR_RE, comp, pos)
+    if end > best[0]:
+        best = (end, PRIOR, None)
+    end = scan(HASH_RE, comp, pos)
+    if end > best[0]:
+        best = (end, HASH, comp[pos:end])
+    if stem_end >= 0:
+        (end, _) = scan_bracket(comp, stem_end, scan_prefix_type)
+        if end > best[0]:
+            best = (end, PREFIX, stem)
+        (end, _) = scan_bracket(comp, stem_end, scan_particle_type)
+        if end > best[0]:
+            best = (end, PARTICLE, stem)
+    end = scan(VERB_PREFIX_RE, comp, pos)
+    if end > best[0]:
+        best = (end, VERB_PREFIX, None)
+    return best
+
+
+def segment_terms(kind, payload):
+    ''' Transform a scanned segment into the list of unary
+        terminal trees the grammar parse action would return.
+    '''
+    if kind == HASH:
+        return [payload]
+    elif kind == FINAL_STEM:
+        (stem, terms) = payload
+        # rename suffix type
+        return [('nbase', stem)] + [
+            (base.replace('SUFFIX', 'NSUFFIX'), word)
+            for (base, word) in terms]
+    elif kind == FINAL_TYPE_STEM:
+        (stem, stype, terms) = payload
+        if terms:
+            # rename suffix type
+            return [(stype.lower() + 'base', stem)] + [
+                ('NSUFFIX' if base == 'SUFFIX' else base, word)
+                for (base, word) in terms]
+        return [('nbase', stem)]
+    elif kind == STEM_TYPE_SUFFIX:
+        (stem, stype, terms) = payload
+        return [(stype.lower() + 'base', stem)] + terms
+    elif kind == STEM_SUFFIX:
+        (stem, terms) = payload
+        return [('nbase', stem)] + terms
+    elif kind == PREFIX:
+        return [(payload, payload)]
+    elif kind == PARTICLE:
+        return [('PARTICLE', payload)]
+    elif kind == VERB_PREFIX:
+        return ['=']
+    raise LexerException('Unknown segment kind: {}'.format(kind))
+
+
+def parse_string(comp):
+    ''' Lex a segmented compound noun into a list of
+        (base, word) unary terminal trees and "#" marks.
+        Drop in replacement for "grammar.compound.parseString".
+
+        Like pyparsing, whitespace in front of every terminal
+        is skipped and lexing stops at the first position no
+        segment matches. If nothing matches at all a
+        LexerException is raised.
+    '''
+    result_list = []
+    pos = 0
+    length = len(comp)
+    while pos < length:
+        (end, kind, payload) = scan_segment(comp, pos)
+        if end < 0:
+            break
+        # prior marks are suppressed
+        if kind != PRIOR:
+            result_list.extend(segment_terms(kind, payload))
+        pos = end
+    if pos == 0:
+        raise LexerException('Could not lex: {}'.format(comp))
+    return result_list
+
+
+# ---------- Equivalence Check ----------------------
+
+# inputs with whitespace inside a line, the corpus has none
+WHITESPACE_CASES = [
+    'Haus<N> #Tür', 'Haus <N>#Boot', 'Haus<N>\tBoot', 'Boot~e <n>',
+    ' Haus', 'Haus ', 'Haus~ e', 'Haus<N> ~e', 'Haus< N >Tür', 'Haus <p>',
+    '@ Haus', '= Haus', '# #Haus', 'Haus<N>\\ \\s<l>', 'Haus<N>\\ <l>#Tür',
+    'Haus<N>\\ s<l>', '   ']
+# marks to put whitespace around in the spaced corpus copy
+MARK_RE = re.compile('([<>#~@])')
+
+
+def build_arg_parse():
+    '''Build a command line parser.'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--in',
+        dest='input',
+        type=str,
+        default=DEFAULT_IN,
+        help='specify file holding the input')
+    return parser
+
+
+def add_whitespace(comp_noun):
+    '''Put a blank before and a tab after every mark.'''
+    return MARK_RE.sub(' \\1\t', comp_noun)
+
+
+def compare(comp_nouns, compound, label='line'):
+    ''' Compare lexer output to the pyparsing "compound"
+        grammar for every compound noun.
+
+        Return list of (idx, compound noun) that differ.
+    '''
+    from pyparsing import ParseException
+    mismatches = []
+    for (idx, comp_noun) in comp_nouns:
+        try:
+            expected = list(compound.parseString(comp_noun))
+        except ParseException:
+            expected = None
+        try:
+            result = parse_string(comp_noun)
+        except LexerException:
+            result = None
+        if result != expected:
+            print 'Mismatch in {} {}: {!r}\n\tgrammar: {}\n\tlexer: {}'.format(
+                label, idx, comp_noun, expected, result)
+            mismatches.append((idx, comp_noun))
+    return mismatches
+
+
+def run():
+    ''' Check lexer against the pyparsing grammar on a segment
+        file, on a copy of it with whitespace around the marks
+        and on the whitespace cases.'''
+    arg_parser = build_arg_parse()
+    args = arg_parser.parse_args()
+    sys.path.insert(
+        0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    import tools
+    import grammar.grammar as grammar
+    comp_nouns = tools.read_from_file(args.input)
+    spaced = [
+        (idx, add_whitespace(comp_noun)) for (idx, comp_noun) in comp_nouns]
+    cases = list(enumerate(WHITESPACE_CASES, 1))
+    mismatches = (
+        compare(comp_nouns, grammar.compound) +
+        compare(spaced, grammar.compound, 'spaced line') +
+        compare(cases, grammar.compound, 'whitespace case'))
+    print 'Compared {} compounds, {} with whitespace, {} mismatches'.format(
+        len(comp_nouns), len(spaced) + len(cases), len(mismatches))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    run()
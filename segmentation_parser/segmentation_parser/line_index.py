@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+'''Define file encoding.'''
+#######################################################
+# name: line_index.py
+# purpose: Memory mapped segment input. An index of line
+# start offsets, cached next to the input, splits the
+# file into byte ranges that workers read straight from
+# the mapping instead of receiving the compound nouns.
+######################################################
+
+import os
+import mmap
+import array
+import bisect
+import tempfile
+
+import tools
+
+# suffix of the cached line index of an input file
+INDEX_SUFFIX = '.lines'
+# open mappings by path, inherited by forked workers
+MAPPINGS = {}
+
+
+def map_file(path):
+    '''Memory map a file read only, once per process.'''
+    if path not in MAPPINGS:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                MAPPINGS[path] = ''
+            else:
+                MAPPINGS[path] = mmap.mmap(
+                    f.fileno(), 0, access=mmap.ACCESS_READ)
+    return MAPPINGS[path]
+
+
+def file_stamp(path):
+    '''Size and modification time of a file as index header.'''
+    stat = os.stat(path)
+    return array.array('l', [stat.st_size, int(stat.st_mtime * 1e6)])
+
+
+def build_line_index(mapping):
+    ''' Offsets of all line starts of a mapped file followed by
+        the file size, line k spans offsets k to k + 1.'''
+    offsets = array.array('l', [0])
+    pos = mapping.find('\n')
+    while pos >= 0:
+        offsets.append(pos + 1)
+        pos = mapping.find('\n', pos + 1)
+    if offsets[-1] != len(mapping):
+        offsets.append(len(mapping))
+    return offsets
+
+
+def read_line_index(index_path, stamp):
+    ''' Read a cached line index. Return None if it is missing,
+        belongs to another version of the input or is
+        incomplete.'''
+    try:
+        with open(index_path, 'rb') as f:
+            header = array.array('l')
+            header.fromfile(f, len(stamp))
+            if header != stamp:
+                return None
+            offsets = array.array('l')
+            count = (os.fstat(f.fileno()).st_size //
+                     offsets.itemsize) - len(stamp)
+            offsets.fromfile(f, count)
+    except (IOError, EOFError):
+        return None
+    # the offsets end with the size of the input
+    if not offsets or offsets[0] != 0 or offsets[-1] != stamp[0]:
+        return None
+    return offsets
+
+
+def write_line_index(index_path, stamp, offsets):
+    ''' Cache a line index. It is written to a temporary file
+        that replaces the cache when complete.'''
+    try:
+        (fd, temp_path) = tempfile.mkstemp(
+            prefix=os.path.basename(index_path) + '.',
+            dir=os.path.dirname(os.path.abspath(index_path)))
+    except (IOError, OSError):
+        # the index is only a cache
+        return
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            stamp.tofile(f)
+            offsets.tofile(f)
+        os.rename(temp_path, index_path)
+    except (IOError, OSError):
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def load_line_index(path, index_path=None):
+    ''' Load the cached line index of "path" from "index_path"
+        (next to the input by default). It is rebuilt and
+        cached again when the input changed or the cache is
+        incomplete.'''
+    if index_path is None:
+        index_path = path + INDEX_SUFFIX
+    stamp = file_stamp(path)
+    offsets = read_line_index(index_path, stamp)
+    if offsets is None:
+        offsets = build_line_index(map_file(path))
+        write_line_index(index_path, stamp, offsets)
+    return offsets
+
+
+def count_lines(offsets):
+    '''Number of lines of an indexed file.'''
+    return len(offsets) - 1
+
+
+def line_range(offsets, start=0, end=None):
+    ''' Lines (first, last + 1) starting in the byte range
+        from "start" to "end" (the end of the file if None).'''
+    first = bisect.bisect_left(offsets, start, 0, count_lines(offsets))
+    if end is None:
+        return (first, count_lines(offsets))
+    return (first, bisect.bisect_left(offsets, end, 0, count_lines(offsets)))
+
+
+def iter_ranges(path, offsets, chunk_size, first=0, last=None):
+    ''' Split the lines "first" to "last" into byte ranges of
+        "chunk_size" lines. Yield (path, start, end, number of
+        the first line) tuples.'''
+    if last is None:
+        last = count_lines(offsets)
+    for line in xrange(first, last, chunk_size):
+        yield (path, offsets[line],
+               offsets[min(line + chunk_size, last)], line + 1)
+
+
+def read_range((path, start, end, first_idx)):
+    ''' Read the compound nouns of a byte range from the mapped
+        input. Return (line number, compound noun) tuples like
+        "tools.iter_from_file".'''
+    lines = map_file(path)[start:end].split('\n')
+    # a range ends after a new line
+    if not lines[-1]:
+        lines.pop()
+    comp_nouns = []
+    for (idx, line) in enumerate(lines, first_idx):
+        line = tools.clean_line(line)
+        if line is not None:
+            comp_nouns.append((idx, line))
+    return comp_nouns
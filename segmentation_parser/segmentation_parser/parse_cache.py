@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+'''Define file encoding.'''
+#######################################################
+# name: parse_cache.py
+# purpose: Persistent sqlite cache that maps segment
+# strings to their generated tree lists. Entries are
+# tagged with a hash of the grammar and tree generator
+# sources and dropped as soon as one of them changes.
+######################################################
+
+import os
+import hashlib
+import sqlite3
+
+# sources the generated trees depend on
+SOURCE_FILES = [
+    'grammar/grammar.py',
+    'grammar/lexer.py',
+    'tree_generator.py',
+]
+# newline never occurs in a tree
+TREE_SEPARATOR = '\n'
+
+
+def source_version():
+    '''Hash the sources of grammar and tree generator.'''
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    md5 = hashlib.md5()
+    for name in SOURCE_FILES:
+        with open(os.path.join(module_dir, name), 'rb') as f:
+            md5.update(f.read())
+    return md5.hexdigest()
+
+
+def clear(cache):
+    '''Remove all cached parses.'''
+    cache.execute('DELETE FROM parses')
+    cache.commit()
+
+
+def open_cache(path, clear_cache=False):
+    ''' Open (or create) the cache at "path".
+
+        Cached parses of an outdated grammar or tree
+        generator are removed, as are all parses if
+        "clear_cache" is set.
+    '''
+    cache = sqlite3.connect(path)
+    # segments and trees are utf-8 encoded byte strings
+    cache.text_factory = str
+    cache.execute(
+        'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+    cache.execute(
+        'CREATE TABLE IF NOT EXISTS parses ('
+        'segment TEXT, max_trees INTEGER, trees TEXT, capped INTEGER, '
+        'PRIMARY KEY (segment, max_trees))')
+    version = source_version()
+    row = cache.execute(
+        "SELECT value FROM meta WHERE key = 'version'").fetchone()
+    if clear_cache or row is None or row[0] != version:
+        clear(cache)
+        cache.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+        cache.commit()
+    return cache
+
+
+def close_cache(cache):
+    '''Commit pending parses and close the cache.'''
+    cache.commit()
+    cache.close()
+
+
+def normalise(comp_noun):
+    '''Normalise a segment string to its cache key.'''
+    return comp_noun.strip()
+
+
+def lookup_chunk(cache, chunk, max_trees, stats):
+    ''' Look up a list of (idx, compound noun) tuples.
+
+        Return (cached, misses): "cached" holds a parse result
+        or None for every tuple of the chunk, "misses" the
+        tuples that need to be parsed. Hits and misses are
+        counted in "stats".
+    '''
+    cached = []
+    misses = []
+    for (idx, comp_noun) in chunk:
+        row = cache.execute(
+            'SELECT trees, capped FROM parses '
+            'WHERE segment = ? AND max_trees = ?',
+            (normalise(comp_noun), max_trees or 0)).fetchone()
+        if row is None:
+            cached.append(None)
+            misses.append((idx, comp_noun))
+        else:
+            (trees, capped) = row
+            cached.append((
+                idx, comp_noun, trees.split(TREE_SEPARATOR), bool(capped)))
+    stats['cache_hits'] += len(chunk) - len(misses)
+    stats['cache_misses'] += len(misses)
+    return (cached, misses)
+
+
+def store_chunk(cache, results, max_trees):
+    ''' Store parse results of a chunk.
+
+        Trees cut short by the time budget are left
+        out, their tree list is not reproducible.
+    '''
+    rows = []
+    for (idx, comp_noun, tree_list, capped) in results:
+        if capped and len(tree_list) != max_trees:
+            continue
+        rows.append((
+            normalise(comp_noun),
+            max_trees or 0,
+            TREE_SEPARATOR.join(tree_list),
+            int(capped)))
+    cache.executemany(
+        'INSERT OR REPLACE INTO parses VALUES (?, ?, ?, ?)', rows)
+    cache.commit()
+
@@ -1,18 +1,46 @@
 # -*- coding: utf-8 -*-
 '''Define file encoding.'''
 
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import argparse
+import collections
+import functools
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import time
 
 from progress.bar import Bar
 import dot_write
+import forest
+import line_index
+import parse_cache
+import shards
 import tools
 import tree_generator
 import grammar.grammar as grammar
+import grammar.lexer as lexer
 
 DOT_DIR = '../../corpora/dot/'
 DEFAULT_IN = '../../corpora/segments/compound_cleaned_random.txt'
 DEFAULT_OUT = '../../corpora/trees/seg_parser.out'
+# compound nouns per worker task
+CHUNK_SIZE = 100
+# chunks in flight or waiting for reordering per worker
+PENDING_PER_WORKER = 4
+# distinct compound nouns remembered for deduplication
+DEDUP_LIMIT = 100000
+# functions that lex a compound noun into unary terminal trees
+ENGINES = {
+    'lexer': lexer.parse_string,
+    'pyparsing': grammar.compound.parseString,
+}
+
+# result of "parse_many" for a single compound noun
+ParseResult = collections.namedtuple(
+    'ParseResult', ['segment', 'trees', 'capped', 'error', 'seconds'])
 
 
 def build_arg_parse():
@@ -30,6 +58,36 @@ def build_arg_parse():
         type=str,
         default=DEFAULT_IN,
         help='specify file holding the input')
+    parser.add_argument(
+        '--mmap',
+        dest='mmap',
+        action='store_true',
+        default=False,
+        help='set to let workers read line ranges of the mapped input')
+    parser.add_argument(
+        '--line-index',
+        dest='line_index',
+        type=str,
+        default=None,
+        help='set file caching the line offsets of the input for "--mmap"')
+    parser.add_argument(
+        '--shard',
+        dest='shard',
+        type=shards.shard_spec,
+        default=None,
+        help='set to parse only shard "i/N" of the input (i from 0)')
+    parser.add_argument(
+        '--packed',
+        dest='packed',
+        action='store_true',
+        default=False,
+        help='set to write a packed forest row per compound')
+    parser.add_argument(
+        '--worker-output',
+        dest='worker_output',
+        action='store_true',
+        default=False,
+        help='set to let workers write rows that are appended in order')
     parser.add_argument(
         '--verbose',
         dest='verbose',
@@ -48,16 +106,100 @@ def build_arg_parse():
         type=str,
         default=DOT_DIR,
         help='set dot file output path')
+    parser.add_argument(
+        '--dot-rewrite',
+        dest='dot_rewrite',
+        action='store_true',
+        default=False,
+        help='set to write every dot file, even if its tree did not change')
+    parser.add_argument(
+        '--dot-format',
+        dest='dot_format',
+        type=str,
+        choices=['files', 'batched'],
+        default='files',
+        help='set to write a dot file per tree or sharded graph files')
+    parser.add_argument(
+        '--dot-shard-size',
+        dest='dot_shard_size',
+        type=int,
+        default=dot_write.SHARD_SIZE,
+        help='set bytes per shard file of batched dot output')
     parser.add_argument(
         '--max-workers',
         dest='max_workers',
         type=int,
         default=1,
         help='set number of prallel workers (cores)')
+    parser.add_argument(
+        '--chunk-size',
+        dest='chunk_size',
+        type=int,
+        default=CHUNK_SIZE,
+        help='set number of compounds sent to a worker at once')
+    parser.add_argument(
+        '--engine',
+        dest='engine',
+        type=str,
+        choices=sorted(ENGINES),
+        default='lexer',
+        help='set engine to parse the morphs of a compound')
+    parser.add_argument(
+        '--max-trees',
+        dest='max_trees',
+        type=int,
+        default=None,
+        help='set maximum number of trees per compound')
+    parser.add_argument(
+        '--time-budget',
+        dest='time_budget',
+        type=float,
+        default=None,
+        help='set seconds to generate the trees of a compound')
+    parser.add_argument(
+        '--sample',
+        dest='sample',
+        type=int,
+        default=None,
+        help='set number of trees per compound drawn at random')
+    parser.add_argument(
+        '--seed',
+        dest='seed',
+        type=int,
+        default=0,
+        help='set random seed of "--sample"')
+    parser.add_argument(
+        '--cache',
+        dest='cache',
+        type=str,
+        default=None,
+        help='set sqlite file caching parses between runs')
+    parser.add_argument(
+        '--clear-cache',
+        dest='clear_cache',
+        action='store_true',
+        default=False,
+        help='set to remove all cached parses before parsing')
+    parser.add_argument(
+        '--dedup-limit',
+        dest='dedup_limit',
+        type=int,
+        default=DEDUP_LIMIT,
+        help='set number of distinct compounds remembered to skip repeats')
     return parser
 
 
-def parse((idx, comp_noun)):
+def sample_rng(comp_noun, seed):
+    ''' Random generator of a compound noun. Seeded by "seed"
+        and the compound, so repeats draw the same sample no
+        matter which worker parses them.'''
+    digest = hashlib.md5('{}\t{}'.format(seed, comp_noun)).hexdigest()
+    return random.Random(int(digest, 16))
+
+
+def parse(
+        (idx, comp_noun), engine='lexer', max_trees=None, time_budget=None,
+        sample=None, seed=0):
     ''' Parse a compound noun in 2 steps:
 
         1. Parse the morphs of the compound into a list
@@ -66,31 +208,351 @@ def parse((idx, comp_noun)):
         2. Generate a list of binary tree variants that
            premutate left, right and central branching.
 
+        "engine" selects the morph parser from ENGINES.
+        The trees are generated lazily up to "max_trees"
+        trees or until "time_budget" seconds are used up.
+        With "sample" only that many trees are drawn
+        uniformly at random from all bracketings instead.
+        The last element of the returned tuple tells
+        whether not every tree was generated because of
+        "max_trees" or "time_budget".
     '''
     # parse list of unary terminal trees
-    result_list = grammar.compound.parseString(comp_noun)
+    result_list = ENGINES[engine](comp_noun)
     if result_list:
         # build a list of possible binary trees from unary
         # terminal trees
-        tree_list = tree_generator.generate(result_list)
+        subtrees = tree_generator.prepare_subtrees(result_list)
+        if sample:
+            trees = tree_generator.sample_trees(
+                subtrees, sample, sample_rng(comp_noun, seed))
+        else:
+            trees = tree_generator.iter_trees(
+                subtrees, max_trees, time_budget)
+        # trees are turned into strings only for the output
+        tree_list = [tree_generator.treetostring(tree) for tree in trees]
         if tree_list:
-            return (idx, comp_noun, tree_list)
+            # a sample is not cut short by the tree limit or budget
+            capped = not sample and len(tree_list) < \
+                tree_generator.count_trees(len(subtrees))
+            return (idx, comp_noun, tree_list, capped)
     print 'Problems with: {} while parsing'.format(comp_noun)
-    return (idx, comp_noun, ['error'])
+    return (idx, comp_noun, ['error'], False)
+
+
+def parse_chunk(chunk, **parse_options):
+    '''Parse a list of (idx, compound noun) tuples.'''
+    return [parse(comp_noun, **parse_options) for comp_noun in chunk]
+
+
+def parse_range(byte_range, **parse_options):
+    ''' Parse the compound nouns of a (path, start, end, number
+        of the first line) byte range of the mapped input.'''
+    return parse_chunk(line_index.read_range(byte_range), **parse_options)
+
+
+def parse_segment(comp_noun, **parse_options):
+    ''' Parse a compound noun into a ParseResult. A compound
+        noun that can not be parsed gets an error message and
+        no trees instead of raising an exception.'''
+    start = time.time()
+    try:
+        (_, _, tree_list, capped) = parse((0, comp_noun), **parse_options)
+        error = None
+        if tree_list == ['error']:
+            (tree_list, error) = ([], 'no trees')
+    except Exception as e:
+        (tree_list, capped) = ([], False)
+        error = '{}: {}'.format(type(e).__name__, e)
+    return ParseResult(
+        comp_noun, tree_list, capped, error, time.time() - start)
+
+
+def parse_segment_chunk(chunk, **parse_options):
+    '''Parse a list of compound nouns into ParseResults.'''
+    return [parse_segment(comp_noun, **parse_options) for comp_noun in chunk]
+
+
+def parse_many(
+        segments, max_workers=1, chunk_size=CHUNK_SIZE, executor=None,
+        **parse_options):
+    ''' Parse an iterable of utf-8 encoded segment strings
+        like "Haus<N>#Tür" and yield a ParseResult with
+        the tree strings, error message and parse time of
+        every segment in input order.
+
+        With more than one of "max_workers" the segments are
+        parsed in chunks of "chunk_size" by a process pool,
+        or by "executor" if one is passed in. "parse_options"
+        ("engine", "max_trees", "time_budget", "sample",
+        "seed") are passed on to "parse".
+    '''
+    if executor is None and max_workers <= 1:
+        for comp_noun in segments:
+            yield parse_segment(comp_noun, **parse_options)
+        return
+    parse_func = functools.partial(parse_segment_chunk, **parse_options)
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        for (_, results) in tools.bounded_map(
+                executor, parse_func, tools.chunks(segments, chunk_size),
+                PENDING_PER_WORKER * max_workers):
+            for result in results:
+                yield result
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+
+def write_chunk((chunk_no, chunk), part_dir, packed=False, **parse_options):
+    ''' Parse a list of (idx, compound noun) tuples or a byte
+        range of the mapped input and write the rows to part
+        file "chunk_no" of "part_dir". Return (number of
+        compound nouns, number of capped compound nouns).'''
+    if type(chunk) is tuple:
+        chunk = line_index.read_range(chunk)
+    parsed = parse_chunk(chunk, **parse_options)
+    rows = [(idx, comp_noun, tree_list)
+            for (idx, comp_noun, tree_list, _) in parsed]
+    if packed:
+        forest.write_packed(rows, part_path(part_dir, chunk_no))
+    else:
+        tools.write_results(rows, part_path(part_dir, chunk_no))
+    return (len(parsed), sum(1 for result in parsed if result[3]))
+
+
+def part_path(part_dir, chunk_no):
+    '''Path of the part file of a chunk.'''
+    return os.path.join(part_dir, '{:08d}'.format(chunk_no))
 
 
-def parallel_parse_helper(comp_nouns, max_workers, bar, verbose=False):
+def worker_write_helper(
+        chunks, out_file, executor, max_workers, bar, stats,
+        verbose=False, packed=False, **parse_options):
+    ''' Let the workers parse and write the chunks to part
+        files and append them to "out_file" in input order.
+
+        Only the numbers of compound nouns and capped compound
+        nouns are sent back. The part files are kept in a
+        temporary directory next to "out_file" and removed
+        as soon as they are appended.
+    '''
+    out_dir = os.path.dirname(os.path.abspath(out_file))
+    part_dir = tempfile.mkdtemp(
+        prefix=os.path.basename(out_file) + '.', dir=out_dir)
+    write_func = functools.partial(
+        write_chunk, part_dir=part_dir, packed=packed, **parse_options)
+    try:
+        with open(out_file, 'wb') as out:
+            for ((chunk_no, _), (num_parsed, num_capped)) in \
+                    tools.bounded_map(
+                        executor, write_func, enumerate(chunks),
+                        PENDING_PER_WORKER * max_workers):
+                tools.append_file(out, part_path(part_dir, chunk_no))
+                stats['total'] += num_parsed
+                stats['capped'] += num_capped
+                if verbose:
+                    bar.next(num_parsed)
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+
+
+def dedup_chunk(chunk, seen, dedup_limit, stats):
+    ''' Split a list of (idx, compound noun) tuples into slots
+        and the (idx, compound noun, result) triples that still
+        need a parse result.
+
+        Every slot is an (idx, compound noun, result) triple
+        whose one element "result" list is filled with the
+        (tree list, capped) pair later on. Repeats of a
+        compound noun share the result list of its first
+        occurrence. "seen" remembers the result lists of the
+        last "dedup_limit" distinct compound nouns.
+    '''
+    slots = []
+    fresh = []
+    for (idx, comp_noun) in chunk:
+        key = parse_cache.normalise(comp_noun)
+        result = seen.pop(key, None)
+        if result is None:
+            result = []
+            fresh.append((idx, comp_noun, result))
+        else:
+            stats['repeats'] += 1
+        # most recently seen compound nouns are evicted last
+        if dedup_limit > 0:
+            seen[key] = result
+            if len(seen) > dedup_limit:
+                seen.popitem(last=False)
+        slots.append((idx, comp_noun, result))
+    stats['total'] += len(chunk)
+    return (slots, fresh)
+
+
+def fill_results(results, parsed):
+    '''Fill result lists with the parse results.'''
+    for (result, (_, _, tree_list, capped)) in zip(results, parsed):
+        result.append((tree_list, capped))
+
+
+def lookup_fresh(cache, fresh, max_trees, stats):
+    ''' Fill the result lists of fresh compound nouns
+        from the "cache" and return the remaining ones.
+    '''
+    (cached, _) = parse_cache.lookup_chunk(
+        cache, [(idx, comp_noun) for (idx, comp_noun, _) in fresh],
+        max_trees, stats)
+    misses = []
+    for (item, hit) in zip(fresh, cached):
+        if hit is None:
+            misses.append(item)
+        else:
+            fill_results([item[2]], [hit])
+    return misses
+
+
+def parallel_parse_helper(
+        comp_nouns, max_workers, bar, stats, verbose=False,
+        chunk_size=CHUNK_SIZE, cache=None, dedup_limit=DEDUP_LIMIT,
+        executor=None, ranges=None, **parse_options):
     ''' Parse compound nouns in parallel.
         "max_workers" specifies number of parallel processes.
+        "parse_options" are passed on to "parse".
+
+        Compound nouns are sent to the workers in chunks of
+        "chunk_size" that may finish in any order. A reorder
+        buffer of at most PENDING_PER_WORKER * max_workers
+        chunks yields the (idx, compound noun, tree list)
+        results in input order as soon as they are ready.
+        Repeated compound nouns are parsed once and their
+        result is fanned out to every line. With a "cache"
+        only uncached compound nouns are sent to the workers.
+        Capped compounds, repeats and cache hits are counted
+        in "stats". An "executor" pool passed in is shared
+        with the caller and left running.
+        With byte "ranges" of the mapped input (see
+        "line_index.iter_ranges") instead of "comp_nouns"
+        the workers read the compound nouns themselves,
+        so they are neither deduplicated nor cached.
     '''
-    results = []
-    # generate list of syntax trees for each compound noun
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        for comp_noun_tuple in executor.map(parse, comp_nouns):
-            results.append(comp_noun_tuple)
-            if verbose:
-                bar.next()
-    return (results, bar)
+    parse_func = functools.partial(parse_chunk, **parse_options)
+    range_func = functools.partial(parse_range, **parse_options)
+    max_trees = parse_options.get('max_trees')
+    max_pending = PENDING_PER_WORKER * max_workers
+    if ranges is not None:
+        chunk_iter = enumerate(ranges)
+    else:
+        chunk_iter = enumerate(tools.chunks(comp_nouns, chunk_size))
+    # normalised compound noun -> shared result list
+    seen = collections.OrderedDict()
+    # future -> (chunk number, result lists of the parsed tuples)
+    running = {}
+    # chunk number -> slots of running chunks
+    running_chunks = {}
+    # chunk number -> slots of finished chunks
+    finished_chunks = {}
+    next_chunk = 0
+    exhausted = False
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        while True:
+            # keep the workers busy as long as the buffer has room
+            while (not exhausted and
+                   len(running) + len(finished_chunks) < max_pending):
+                try:
+                    (chunk_no, chunk) = next(chunk_iter)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if ranges is not None:
+                    running[executor.submit(range_func, chunk)] = (
+                        chunk_no, None)
+                    continue
+                (slots, fresh) = dedup_chunk(chunk, seen, dedup_limit, stats)
+                misses = fresh
+                if cache is not None and fresh:
+                    misses = lookup_fresh(cache, fresh, max_trees, stats)
+                if misses:
+                    future = executor.submit(parse_func, [
+                        (idx, comp_noun) for (idx, comp_noun, _) in misses])
+                    running[future] = (
+                        chunk_no, [result for (_, _, result) in misses])
+                    running_chunks[chunk_no] = slots
+                else:
+                    finished_chunks[chunk_no] = slots
+            # pass on the contiguous prefix of finished chunks, the
+            # first occurrence of a repeat is always passed on earlier
+            while next_chunk in finished_chunks:
+                for (idx, comp_noun, result) in \
+                        finished_chunks.pop(next_chunk):
+                    (tree_list, capped) = result[0]
+                    if capped:
+                        stats['capped'] += 1
+                    if verbose:
+                        bar.next()
+                    yield (idx, comp_noun, tree_list)
+                next_chunk += 1
+            if not running:
+                if exhausted:
+                    break
+                continue
+            (done, _) = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                (chunk_no, results) = running.pop(future)
+                parsed = future.result()
+                if cache is not None:
+                    parse_cache.store_chunk(cache, parsed, max_trees)
+                if results is None:
+                    # byte range read by the worker
+                    stats['total'] += len(parsed)
+                    finished_chunks[chunk_no] = [
+                        (idx, comp_noun, [(tree_list, capped)])
+                        for (idx, comp_noun, tree_list, capped) in parsed]
+                    continue
+                fill_results(results, parsed)
+                finished_chunks[chunk_no] = running_chunks.pop(chunk_no)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+
+def write_parallel(
+        comp_nouns, ranges, output_loc, executor, bar, stats, cache, args):
+    ''' Parse in the worker pool and write the results (and
+        dot files) from the main process.'''
+    results = parallel_parse_helper(
+        comp_nouns, args.max_workers, bar, stats, args.verbose,
+        chunk_size=args.chunk_size,
+        cache=cache,
+        dedup_limit=args.dedup_limit,
+        executor=executor,
+        ranges=ranges,
+        engine=args.engine,
+        max_trees=args.max_trees,
+        time_budget=args.time_budget,
+        sample=args.sample,
+        seed=args.seed)
+    # write dot files while results pass by
+    if args.dot and args.dot_format == 'batched':
+        results = dot_write.write_batched(
+            results, args.dot_dir, executor,
+            PENDING_PER_WORKER * args.max_workers,
+            chunk_size=args.chunk_size,
+            shard_size=args.dot_shard_size)
+    elif args.dot:
+        results = dot_write.write_each(
+            results, args.dot_dir,
+            dot_write.manifest_name(args.input, args.shard),
+            stats, args.dot_rewrite)
+    # write results to file as they arrive
+    if args.packed:
+        forest.write_packed(results, output_loc)
+    else:
+        tools.write_results(results, output_loc)
 
 
 def run():
@@ -98,27 +560,100 @@ def run():
     # parse command line arguments
     arg_parser = build_arg_parse()
     args = arg_parser.parse_args()
+    if args.sample and (args.max_trees or args.time_budget):
+        arg_parser.error('--sample replaces --max-trees and --time-budget')
+    if args.sample and args.cache:
+        arg_parser.error('--sample parses can not be cached')
+    if args.sample and args.packed:
+        arg_parser.error('--packed rows can not hold sampled trees')
+    if args.mmap and args.cache:
+        arg_parser.error('--mmap workers read uncached compounds')
+    if args.shard and args.dot and args.dot_format == 'batched':
+        arg_parser.error('--shard runs would share batched dot files')
+    if args.worker_output and (args.cache or args.dot):
+        arg_parser.error('--worker-output rows can not be cached or drawn')
     # get output file path
     output_loc = args.output
-    # read in compound noun list
-    comp_nouns = tools.read_from_file(args.input)
-    if comp_nouns:
-        # show process bar
-        if args.verbose:
-            print 'Segmented Compound Noun Parser Version 1.0'
-            bar = Bar('Parse nouns\t', max=len(comp_nouns))
-        (results, bar) = parallel_parse_helper(
-            comp_nouns, args.max_workers, bar, args.verbose)
-        if args.verbose:
-            bar.finish()
-        # write results to file
+    if args.shard and output_loc == DEFAULT_OUT:
+        output_loc = '{}.{}-{}'.format(output_loc, *args.shard)
+    (comp_nouns, ranges) = (None, None)
+    if args.mmap:
+        # map the input before the workers are forked
+        line_index.map_file(args.input)
+        offsets = line_index.load_line_index(args.input, args.line_index)
+        (first, last) = (0, line_index.count_lines(offsets))
+        if args.shard:
+            (shard, num_shards) = args.shard
+            size = offsets[-1]
+            (first, last) = line_index.line_range(
+                offsets,
+                shard * size // num_shards,
+                (shard + 1) * size // num_shards)
+        num_lines = last - first
+        ranges = line_index.iter_ranges(
+            args.input, offsets, args.chunk_size, first, last)
+    else:
+        # byte range of the input and number of its first line
+        (start, end, first_idx) = (0, None, 1)
+        if args.shard:
+            (start, end, first_idx) = shards.shard_range(
+                args.input, *args.shard)
+        # read compound nouns lazily, the workers pull them through
+        # the bounded reorder buffer of "parallel_parse_helper"
+        comp_nouns = tools.iter_from_file(
+            args.input, start, end, first_idx)
         if args.verbose:
-            print 'Writing parse results to {}'.format(output_loc)
-        if results:
-            tools.write_results(results, output_loc)
-            # write dot file
-            if args.dot:
-                dot_write.write(results, args.dot_dir, args.verbose)
+            num_lines = tools.count_lines(args.input, start, end)
+    bar = None
+    stats = {
+        'capped': 0, 'cache_hits': 0, 'cache_misses': 0,
+        'total': 0, 'repeats': 0}
+    cache = None
+    if args.cache:
+        cache = parse_cache.open_cache(args.cache, args.clear_cache)
+    # show process bar
+    if args.verbose:
+        print 'Segmented Compound Noun Parser Version 1.0'
+        print 'Writing parse results to {}'.format(output_loc)
+        bar = Bar('Parse nouns\t', max=num_lines)
+    # parsing and graph generation share the worker pool
+    executor = ProcessPoolExecutor(max_workers=args.max_workers)
+    if args.worker_output:
+        if ranges is None:
+            ranges = tools.chunks(comp_nouns, args.chunk_size)
+        worker_write_helper(
+            ranges, output_loc, executor, args.max_workers, bar, stats,
+            args.verbose,
+            packed=args.packed,
+            engine=args.engine,
+            max_trees=args.max_trees,
+            time_budget=args.time_budget,
+            sample=args.sample,
+            seed=args.seed)
+    else:
+        write_parallel(
+            comp_nouns, ranges, output_loc, executor, bar, stats, cache,
+            args)
+    executor.shutdown()
+    if cache is not None:
+        parse_cache.close_cache(cache)
+    if args.verbose:
+        bar.finish()
+        print '{} compounds hit the tree limit or time budget'.format(
+            stats['capped'])
+        distinct = stats['total'] - stats['repeats']
+        print 'Deduplication: {} compounds, {} distinct, ratio {:.3f}'.format(
+            stats['total'], distinct,
+            float(distinct) / stats['total'] if stats['total'] else 1.0)
+        if cache is not None:
+            print 'Parse cache: {} hits, {} misses'.format(
+                stats['cache_hits'], stats['cache_misses'])
+        if args.dot:
+            print 'Writing dot files to {}'.format(args.dot_dir)
+        if args.dot and args.dot_format == 'files':
+            print 'Dot files: {} written, {} unchanged, {} removed'.format(
+                stats['dot_written'], stats['dot_unchanged'],
+                stats['dot_removed'])
 
 
 if __name__ == '__main__':
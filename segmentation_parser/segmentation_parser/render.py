@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+'''Define file encoding.'''
+#######################################################
+# name: render.py
+# purpose: Render the dot graphs written by "dot_write"
+# to images in a bounded pool of worker processes.
+# Images newer than their dot source are skipped.
+######################################################
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import time
+import functools
+import argparse
+import multiprocessing
+
+import graphviz
+from progress.counter import Counter
+
+import dot_write
+import tools
+
+DOT_DIR = dot_write.DOT_DIR
+# graphs rendered per worker task
+CHUNK_SIZE = 20
+# tasks in flight per worker
+PENDING_PER_WORKER = 4
+
+
+def build_arg_parse():
+    '''Build a command line parser.'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--dot-dir',
+        dest='dot_dir',
+        type=str,
+        default=DOT_DIR,
+        help='set path of the dot files')
+    parser.add_argument(
+        '--out-dir',
+        dest='out_dir',
+        type=str,
+        default=None,
+        help='set image output path (defaults to the dot file path)')
+    parser.add_argument(
+        '--dot-format',
+        dest='dot_format',
+        type=str,
+        choices=['files', 'batched'],
+        default='files',
+        help='set to render a dot file per tree or sharded graph files')
+    parser.add_argument(
+        '--format',
+        dest='format',
+        type=str,
+        default='png',
+        help='set image format like png or svg')
+    parser.add_argument(
+        '--max-workers',
+        dest='max_workers',
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help='set number of prallel workers (defaults to all cores)')
+    parser.add_argument(
+        '--force',
+        dest='force',
+        action='store_true',
+        default=False,
+        help='set to render images that are up to date')
+    parser.add_argument(
+        '--verbose',
+        dest='verbose',
+        action='store_true',
+        default=False,
+        help='set to generate process information')
+    return parser
+
+
+def file_sources(dot_dir):
+    ''' Yield (name, (path, offset, length)) of every dot file
+        in "dot_dir". A length of None reads the whole file.'''
+    for name in sorted(os.listdir(dot_dir)):
+        if name.endswith('.dot') and not name.startswith('graphs_'):
+            yield (name, (os.path.join(dot_dir, name), 0, None))
+
+
+def batched_sources(dot_dir):
+    ''' Yield (name, (path, offset, length)) of every graph
+        listed in the index of batched dot output. Names
+        are the file names "--dot-format files" would use.'''
+    with open(dot_dir + dot_write.INDEX_NAME, 'r') as index:
+        for line in index:
+            (graph_id, name, shard, offset, length) = \
+                line.rstrip('\n').split('\t')
+            yield ('{}_{}.dot'.format(graph_id, name), (
+                os.path.join(dot_dir, shard), int(offset), int(length)))
+
+
+def outdated(sources, out_dir, fmt, force, stats):
+    ''' Yield (source, image path) of every source whose
+        image is missing or older than the dot source.
+        Up to date images are counted in "stats".'''
+    for (name, source) in sources:
+        # same naming as "dot -T<fmt> -O"
+        out_path = os.path.join(out_dir, '{}.{}'.format(name, fmt))
+        if not force and os.path.exists(out_path) and \
+                os.path.getmtime(out_path) >= os.path.getmtime(source[0]):
+            stats['up_to_date'] += 1
+            continue
+        yield (source, out_path)
+
+
+def read_source((path, offset, length)):
+    '''Read a dot graph from a file or a shard.'''
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        if length is None:
+            return f.read()
+        return f.read(length)
+
+
+def render_chunk(jobs, fmt='png'):
+    '''Render a list of (source, image path) tuples.'''
+    for (source, out_path) in jobs:
+        graph = graphviz.Source(read_source(source).decode('utf-8'))
+        image = graph.pipe(format=fmt)
+        with open(out_path, 'wb') as out_file:
+            out_file.write(image)
+    return len(jobs)
+
+
+def render(sources, out_dir, fmt, max_workers, stats, force=False, bar=None):
+    ''' Render the outdated "sources" to "fmt" images in
+        "out_dir" with "max_workers" processes. At most
+        PENDING_PER_WORKER tasks per worker are in flight.
+        Rendered and up to date graphs are counted in "stats".'''
+    jobs = outdated(sources, out_dir, fmt, force, stats)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for (_, rendered) in tools.bounded_map(
+                executor,
+                functools.partial(render_chunk, fmt=fmt),
+                tools.chunks(jobs, CHUNK_SIZE),
+                PENDING_PER_WORKER * max_workers):
+            stats['rendered'] += rendered
+            if bar is not None:
+                for _ in range(rendered):
+                    bar.next()
+
+
+def run():
+    '''Wrapper function.'''
+    arg_parser = build_arg_parse()
+    args = arg_parser.parse_args()
+    out_dir = args.out_dir or args.dot_dir
+    if args.out_dir and not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    if args.dot_format == 'batched':
+        sources = batched_sources(args.dot_dir)
+    else:
+        sources = file_sources(args.dot_dir)
+    stats = {'rendered': 0, 'up_to_date': 0}
+    bar = None
+    if args.verbose:
+        print 'Rendering dot graphs of {} to {}'.format(args.dot_dir, out_dir)
+        bar = Counter('Render graphs\t')
+    start = time.time()
+    render(sources, out_dir, args.format, args.max_workers, stats,
+           args.force, bar)
+    seconds = time.time() - start
+    if args.verbose:
+        bar.finish()
+    throughput = stats['rendered'] / seconds if seconds else 0.0
+    print '{} graphs rendered, {} up to date in {:.1f}s'.format(
+        stats['rendered'], stats['up_to_date'], seconds)
+    print 'Throughput: {:.1f} graphs/s'.format(throughput)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+'''Define file encoding.'''
+#######################################################
+# name: service.py
+# purpose: Long running parse service. Keeps grammar and
+# worker pool warm and answers line delimited JSON
+# requests on a unix socket or a localhost TCP port.
+# Concurrent requests are parsed in shared batches and
+# recent results are kept in an in memory LRU.
+######################################################
+
+from concurrent.futures import ProcessPoolExecutor, wait
+import os
+import json
+import time
+import Queue
+import signal
+import socket
+import argparse
+import threading
+import collections
+import SocketServer
+
+import parser
+import tools
+
+HOST = 'localhost'
+PORT = 8642
+# seconds a batch waits for more requests
+BATCH_WINDOW = 0.002
+# compound nouns of all requests in a batch
+BATCH_SIZE = 1000
+# compound nouns per worker task
+CHUNK_SIZE = 50
+# recent results kept in memory
+LRU_SIZE = 10000
+# per request parse options, others are set for the service
+REQUEST_OPTIONS = ('max_trees', 'sample', 'seed')
+
+
+class ServiceException(Exception):
+    pass
+
+
+def build_arg_parse():
+    '''Build a command line parser.'''
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '--socket',
+        dest='socket',
+        type=str,
+        default=None,
+        help='set unix socket path to listen on instead of TCP')
+    arg_parser.add_argument(
+        '--host',
+        dest='host',
+        type=str,
+        default=HOST,
+        help='set host to listen on')
+    arg_parser.add_argument(
+        '--port',
+        dest='port',
+        type=int,
+        default=PORT,
+        help='set TCP port to listen on')
+    arg_parser.add_argument(
+        '--max-workers',
+        dest='max_workers',
+        type=int,
+        default=1,
+        help='set number of prallel workers (cores)')
+    arg_parser.add_argument(
+        '--chunk-size',
+        dest='chunk_size',
+        type=int,
+        default=CHUNK_SIZE,
+        help='set number of compounds sent to a worker at once')
+    arg_parser.add_argument(
+        '--batch-window',
+        dest='batch_window',
+        type=float,
+        default=BATCH_WINDOW,
+        help='set seconds a batch waits for concurrent requests')
+    arg_parser.add_argument(
+        '--lru-size',
+        dest='lru_size',
+        type=int,
+        default=LRU_SIZE,
+        help='set number of recent results kept in memory')
+    arg_parser.add_argument(
+        '--engine',
+        dest='engine',
+        type=str,
+        choices=sorted(parser.ENGINES),
+        default='lexer',
+        help='set engine to parse the morphs of a compound')
+    arg_parser.add_argument(
+        '--time-budget',
+        dest='time_budget',
+        type=float,
+        default=None,
+        help='set seconds to generate the trees of a compound')
+    return arg_parser
+
+
+def result_dict(result):
+    '''JSON result of a ParseResult.'''
+    if result.error is not None:
+        return {'error': result.error}
+    return {'trees': result.trees, 'capped': result.capped}
+
+
+class ParseService(object):
+    ''' Batch parse requests of concurrent connections.
+
+        "submit" queues a request and blocks until the batch
+        thread has parsed it together with the requests that
+        arrived within "batch_window" seconds.
+    '''
+
+    def __init__(
+            self, max_workers=1, chunk_size=CHUNK_SIZE,
+            batch_window=BATCH_WINDOW, lru_size=LRU_SIZE, **parse_options):
+        self.max_workers = max_workers
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.chunk_size = chunk_size
+        self.batch_window = batch_window
+        self.lru_size = lru_size
+        self.parse_options = parse_options
+        # (compound noun, request options) -> result dict
+        self.lru = collections.OrderedDict()
+        self.requests = Queue.Queue()
+        self.stats = {'requests': 0, 'segments': 0, 'lru_hits': 0}
+        self.thread = threading.Thread(target=self.batch_loop)
+        self.thread.daemon = True
+
+    def start(self):
+        '''Start the worker processes and the batch thread.'''
+        # start every worker and build the grammar before serving
+        warm_up = [
+            self.executor.submit(parser.parse_segment_chunk, ['Haus#Tür'])
+            for _ in range(self.max_workers)]
+        wait(warm_up)
+        self.thread.start()
+
+    def shutdown(self):
+        '''Stop the worker processes.'''
+        self.executor.shutdown()
+
+    def submit(self, segments, options):
+        '''Parse compound nouns, wait for and return the results.'''
+        request = {
+            'segments': segments,
+            'options': options,
+            'results': None,
+            'done': threading.Event(),
+        }
+        self.requests.put(request)
+        request['done'].wait()
+        return request['results']
+
+    def next_batch(self):
+        ''' Block for a request, then collect the requests that
+            arrive within the batch window.'''
+        batch = [self.requests.get()]
+        size = len(batch[0]['segments'])
+        deadline = time.time() + self.batch_window
+        while size < BATCH_SIZE:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except Queue.Empty:
+                break
+            batch.append(request)
+            size += len(request['segments'])
+        return batch
+
+    def lookup(self, key):
+        '''Return a recent result and mark it as most recent.'''
+        result = self.lru.pop(key, None)
+        if result is not None:
+            self.lru[key] = result
+        return result
+
+    def remember(self, key, result):
+        '''Keep a result, evict the least recent ones.'''
+        if self.lru_size <= 0 or result.get('capped') and \
+                self.parse_options.get('time_budget'):
+            return
+        self.lru[key] = result
+        while len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    def parse_batch(self, batch):
+        ''' Parse the distinct compound nouns of a batch that are
+            not in the LRU and fill in the results of every request.'''
+        found = {}
+        misses = collections.defaultdict(list)
+        for request in batch:
+            options = request['options']
+            for comp_noun in request['segments']:
+                key = (comp_noun, options)
+                if key in found:
+                    continue
+                result = self.lookup(key)
+                if result is None:
+                    found[key] = None
+                    misses[options].append(comp_noun)
+                else:
+                    found[key] = result
+                    self.stats['lru_hits'] += 1
+        # parse misses in chunks, one option set at a time
+        futures = {}
+        for (options, segments) in misses.iteritems():
+            parse_options = dict(self.parse_options)
+            parse_options.update(
+                (name, value) for (name, value) in options
+                if value is not None)
+            for chunk in tools.chunks(segments, self.chunk_size):
+                future = self.executor.submit(
+                    parser.parse_segment_chunk, chunk, **parse_options)
+                futures[future] = (options, chunk)
+        for future in futures:
+            (options, chunk) = futures[future]
+            for (comp_noun, result) in zip(chunk, future.result()):
+                result = result_dict(result)
+                found[(comp_noun, options)] = result
+                self.remember((comp_noun, options), result)
+        for request in batch:
+            request['results'] = [
+                found[(comp_noun, request['options'])]
+                for comp_noun in request['segments']]
+            self.stats['requests'] += 1
+            self.stats['segments'] += len(request['segments'])
+
+    def batch_loop(self):
+        '''Parse batches of requests until the process ends.'''
+        while True:
+            batch = self.next_batch()
+            try:
+                self.parse_batch(batch)
+            except Exception as e:
+                for request in batch:
+                    request['results'] = ServiceException(str(e))
+            for request in batch:
+                request['done'].set()
+
+
+def request_options(request):
+    '''Hashable per request parse options of a JSON request.'''
+    options = []
+    for name in REQUEST_OPTIONS:
+        value = request.get(name)
+        if value is not None and not isinstance(value, int):
+            raise ServiceException('"{}" must be an integer'.format(name))
+        options.append((name, value))
+    return tuple(options)
+
+
+def handle_request(service, line):
+    ''' Answer a JSON request line like
+
+        {"id": 1, "segments": ["Haus<N>#Tür"], "max_trees": 10}
+
+        with a JSON response line like
+
+        {"id": 1, "results": [{"trees": [...], "capped": false}],
+         "seconds": 0.003}
+    '''
+    start = time.time()
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ServiceException('request must be a JSON object')
+        segments = request.get('segments')
+        if segments is None and 'segment' in request:
+            segments = [request['segment']]
+        if not isinstance(segments, list) or not all(
+                isinstance(segment, basestring) for segment in segments):
+            raise ServiceException('"segments" must be a list of strings')
+        options = request_options(request)
+        results = service.submit(
+            [segment.encode('utf-8').strip() for segment in segments],
+            options)
+        if isinstance(results, Exception):
+            raise results
+        response = {'id': request.get('id'), 'results': results}
+    except (ValueError, ServiceException) as e:
+        response = {'error': str(e)}
+    response['seconds'] = round(time.time() - start, 6)
+    return json.dumps(response) + '\n'
+
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+    '''Answer the request lines of a connection.'''
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            self.wfile.write(handle_request(self.server.service, line))
+            self.wfile.flush()
+
+
+class TCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class UnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+def query(address, segments, **options):
+    ''' Send a request to a running service and return its
+        response. "address" is a unix socket path or a
+        (host, port) tuple.'''
+    if isinstance(address, tuple):
+        connection = socket.create_connection(address)
+    else:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(address)
+    request = dict(options, segments=[
+        segment.decode('utf-8') for segment in segments])
+    try:
+        connection.sendall(json.dumps(request) + '\n')
+        response = connection.makefile('r').readline()
+    finally:
+        connection.close()
+    return json.loads(response)
+
+
+def stop(signum, frame):
+    '''Leave the serve loop on SIGTERM like on Ctrl-C.'''
+    raise KeyboardInterrupt()
+
+
+def run():
+    '''Serve parse requests until interrupted or terminated.'''
+    arg_parser = build_arg_parse()
+    args = arg_parser.parse_args()
+    service = ParseService(
+        max_workers=args.max_workers,
+        chunk_size=args.chunk_size,
+        batch_window=args.batch_window,
+        lru_size=args.lru_size,
+        engine=args.engine,
+        time_budget=args.time_budget)
+    service.start()
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixServer(args.socket, RequestHandler)
+        print 'Segmentation parse service on {}'.format(args.socket)
+    else:
+        server = TCPServer((args.host, args.port), RequestHandler)
+        print 'Segmentation parse service on {}:{}'.format(
+            args.host, args.port)
+    server.service = service
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+        print 'Served {} requests with {} compounds, {} LRU hits'.format(
+            service.stats['requests'], service.stats['segments'],
+            service.stats['lru_hits'])
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+'''Define file encoding.'''
+#######################################################
+# name: shards.py
+# purpose: Split a segment file into byte ranges aligned
+# to line starts, so shards can be parsed on separate
+# hosts, and merge the shard outputs by line id.
+######################################################
+
+import os
+import heapq
+import argparse
+
+DEFAULT_OUT = '../../corpora/trees/seg_parser.out'
+# bytes read at once while counting lines
+BLOCK_SIZE = 1024 * 1024
+
+
+def shard_spec(spec):
+    ''' Parse a shard specification "i/N" into (i, N),
+        shards are numbered from 0 to N - 1.'''
+    try:
+        (shard, num_shards) = [int(part) for part in spec.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'shard must look like "i/N": {}'.format(spec))
+    if not 0 <= shard < num_shards:
+        raise argparse.ArgumentTypeError(
+            'shard must be in 0 ... N - 1: {}'.format(spec))
+    return (shard, num_shards)
+
+
+def line_start(f, pos):
+    '''First line start at or after byte "pos".'''
+    if pos == 0:
+        return 0
+    f.seek(pos - 1)
+    f.readline()
+    return f.tell()
+
+
+def count_newlines(f, end):
+    '''Count the new lines before byte "end".'''
+    f.seek(0)
+    count = 0
+    while f.tell() < end:
+        count += f.read(min(BLOCK_SIZE, end - f.tell())).count('\n')
+    return count
+
+
+def shard_range(path, shard, num_shards):
+    ''' Byte range of shard "shard" of "num_shards" of a file.
+
+        Shards get about the same number of bytes and hold
+        the lines that start in their range. Return (start,
+        end, number of the first line) so line numbers stay
+        the same as in a run over the whole file.
+    '''
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        start = line_start(f, shard * size // num_shards)
+        end = line_start(f, (shard + 1) * size // num_shards)
+        first_idx = count_newlines(f, start) + 1
+    return (start, end, first_idx)
+
+
+def row_key(row):
+    '''Sort key of an output row: its numeric id.'''
+    return tuple(int(part) for part in row.split('\t', 1)[0].split('_'))
+
+
+def keyed_rows(path):
+    '''Yield (sort key, row) of a shard output file.'''
+    with open(path, 'r') as f:
+        for row in f:
+            yield (row_key(row), row)
+
+
+def merge(paths, out_file):
+    ''' Merge shard output files, each sorted by id,
+        into one output file sorted by id.'''
+    with open(out_file, 'w') as out:
+        for (_, row) in heapq.merge(*[keyed_rows(path) for path in paths]):
+            out.write(row)
+
+
+def build_arg_parse():
+    '''Build a command line parser.'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--out',
+        dest='output',
+        type=str,
+        default=DEFAULT_OUT,
+        help='specify file holding the merged output')
+    parser.add_argument(
+        'shard_outputs',
+        nargs='+',
+        help='output files of the shards')
+    return parser
+
+
+def run():
+    '''Merge the outputs of "parser.py --shard" runs.'''
+    arg_parser = build_arg_parse()
+    args = arg_parser.parse_args()
+    merge(args.shard_outputs, args.output)
+
+
+if __name__ == '__main__':
+    run()
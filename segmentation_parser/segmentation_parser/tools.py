@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 '''Define file encoding.'''
 
+import collections
+import itertools
+import mmap
+import os
 import re
 
 
@@ -18,19 +22,51 @@ def unsplit_compound(compound):
     return comp_restored
 
 
+def clean_line(line):
+    ''' Turn a latin-1 input line into a utf-8 compound noun.
+        Return None if the line is marked as comment.'''
+    # clean each line
+    line = line.decode('latin-1').encode('utf-8')
+    line = line.strip()
+    # if line is marked as comment ignore it
+    if line[0] != '#':
+        return line
+    return None
+
+
+def iter_lines(path, start=0, end=None):
+    ''' Lazily read the lines starting in the byte range
+        from "start" to "end" (the end of the file if None).'''
+    with open(path, 'r') as f:
+        f.seek(start)
+        pos = start
+        for line in f:
+            if end is not None and pos >= end:
+                break
+            pos += len(line)
+            yield line
+
+
+def iter_from_file(path, start=0, end=None, first_idx=1):
+    ''' Lazily read compound nouns line wise form input file.
+        Yield (line number, compound noun) tuples.
+
+        Only lines in the byte range from "start" to "end"
+        are read, the first one has number "first_idx".'''
+    for (idx, line) in enumerate(iter_lines(path, start, end), first_idx):
+        line = clean_line(line)
+        if line is not None:
+            yield (idx, line)
+
+
 def read_from_file(path):
     ''' Read compound nouns line wise form input file.'''
-    comp_nouns = []
-    with open(path, 'r') as f:
-        for (idx, line) in enumerate(f, start=1):
-            # clean each line
-            line = line.decode('latin-1').encode('utf-8')
-            line = line.strip()
-            # if line is marked as comment ignore it
-            if line[0] != '#':
-                comp_nouns.append((idx, line))
-        f.close()
-    return comp_nouns
+    return list(iter_from_file(path))
+
+
+def count_lines(path, start=0, end=None):
+    '''Count lines of a file (byte range) without keeping them.'''
+    return sum(1 for line in iter_lines(path, start, end))
 
 
 def write_results(pairs, out_file):
@@ -58,3 +94,39 @@ def write_results(pairs, out_file):
                 tree)
             out_file.write(out_str)
     out_file.close()
+
+
+def chunks(items, chunk_size):
+    '''Split an iterable into lists of "chunk_size" items.'''
+    items = iter(items)
+    chunk = list(itertools.islice(items, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(items, chunk_size))
+
+
+def bounded_map(executor, func, items, max_pending):
+    ''' Apply "func" to the items in the "executor" pool.
+        Yield (item, result) tuples in order while keeping
+        at most "max_pending" items submitted.'''
+    pending = collections.deque()
+    for item in items:
+        pending.append((item, executor.submit(func, item)))
+        if len(pending) >= max_pending:
+            (item, future) = pending.popleft()
+            yield (item, future.result())
+    while pending:
+        (item, future) = pending.popleft()
+        yield (item, future.result())
+
+
+def append_file(out_file, path):
+    ''' Append the file "path" to the open "out_file" and remove
+        it. The file is written from a memory mapping, so it is
+        not copied into a string first.'''
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            out_file.write(mapping)
+            mapping.close()
+    os.remove(path)
@@ -1,48 +1,42 @@
 # -*- coding: utf-8 -*-
 '''Define file encoding.'''
 
+import itertools
+import re
+import time
+
 
 class TreeGeneratorException(Exception):
     pass
 
 
-def tree_string_to_list(tree):
-    '''Parse tree string to list.'''
-    parse_input = '({})'.format(tree)
-    return nestedExpr().parseString(parse_input).asList()[0]
+class Node(object):
+    ''' Tree node (root, lhs, rhs), unary nodes have an empty lhs.
 
+        Nodes are built with "make_node", so identical subtrees
+        of a compound are the same object and the bracketed
+        string of a node is built only once.
+    '''
+    __slots__ = ('root', 'lhs', 'rhs', 'bracketed')
 
-def parse_final_stem(result):
-    ''' Transform parser result:
+    def __init__(self, root, lhs, rhs):
+        self.root = root
+        self.lhs = lhs
+        self.rhs = rhs
+        self.bracketed = None
 
-        [ 'final stem', 'suffix'*]
+    def __iter__(self):
+        return iter((self.root, self.lhs, self.rhs))
 
-        to bracket structure:
 
-        ('nbase' 'stem') ... (Optional suffixes)
-    '''
-    #print 'Final stem parse result: %s' % str(result)
-    if len(result) > 1:
-        # rename suffix type
-        suffix_str = ' '.join(result[1:])
-        suffix_str = suffix_str.replace('SUFFIX', 'NSUFFIX')
-        return '(nbase {}) {}'.format(result[0], suffix_str)
-    return '(nbase {})'.format(result[0])
-
-
-def split_suffix_structures(result):
-    '''Parses might return complex parse strings
-       like "(a b) (c d)" that need to be split
-       into separate tuple strings like "(a b)"
-       and "(c d)".'''
-    split_suffix_results = []
-    for elem in result:
-        while elem.find(') (') > -1:
-            idx = elem.find(') (')
-            split_suffix_results.append(elem[0:idx+1])
-            elem = elem[idx+2:]
-        split_suffix_results.append(elem)
-    return split_suffix_results
+def make_node(root, lhs, rhs, table):
+    '''Return the node (root, lhs, rhs) interned in "table".'''
+    key = (root, lhs, rhs)
+    node = table.get(key)
+    if node is None:
+        node = Node(root, lhs, rhs)
+        table[key] = node
+    return node
 
 
 CAT_DICT = {
@@ -76,15 +70,15 @@ def get_root_node(lroot, rroot):
     return rroot
 
 
-def merge(lhs, rhs, cat_dict=CAT_DICT):
+def merge(lhs, rhs, table, cat_dict=CAT_DICT):
     ''' Merge trees.'''
     (lroot, llhs, lrhs) = lhs
     (rroot, rlhs, rrhs) = rhs
     root = get_root_node(lroot, rroot)
-    return (root, lhs, rrhs)
+    return make_node(root, lhs, rrhs, table)
 
 
-def build_binary_subtrees(term_list, cat_dict=CAT_DICT):
+def build_binary_subtrees(term_list, table, cat_dict=CAT_DICT):
     ''''''
     binary_tree_list = []
     last_term = ''
@@ -95,227 +89,325 @@ def build_binary_subtrees(term_list, cat_dict=CAT_DICT):
                 last_term = ''
         else:
             if last_term:
-                last_term = merge(last_term, term)
+                last_term = merge(last_term, term, table)
             else:
                 last_term = term
     binary_tree_list.append(last_term)
     return binary_tree_list
 
 
-def treetostring(tup):
-    ''''''
-    if type(tup) == str:
-        return tup
-    (root, lhs, rhs) = tup
-    if type(lhs) == tuple:
-        lhs = treetostring(lhs)
-    if type(rhs) == tuple:
-        rhs = treetostring(rhs)
-    if lhs == '':
-        return '({} {})'.format(root, rhs)
-    return '({} {} {})'.format(root, lhs, rhs)
-
-
-def balanced_append((i, j, tree)):
-    '''Tuple two subtrees of the list in "tree"
-       to generate a binary branching relation.
-
-         rooti      rootj
-           |          |
-       childreni    childrenj
-
-       The new root node is a comp node
-       that subordinates the two subtrees.
-
-               comp
-               /  \
-              /    \
-           rooti  rootj
-             |      |
-       childreni  childrenj
-
-       '''
-    bal_tree = list(tree)
-    bal_tree[i] = ('comp', bal_tree[i], bal_tree[j])
-    bal_tree.pop(j)
-    return bal_tree
-
-
-def left_append((i, j, tree)):
-    '''Tuple two subtrees of the list in "tree"
-       to generate a binary branching relation.
-
-         rooti      rootj
-           |          |
-       childreni    childrenj
-
-       The new root node is a comp node
-       that replaces the root node of
-       the left hand subtree indexed with
-       index i. The result looks like:
-
-               comp
-               /  \
-              /    \
-        childreni rootj
-                    |
-                  childrenj
-
-       '''
-    subtreei = ""
-    subtreej = ""
-    left_tree = list(tree)
-    # append to the left
-    (_, lhsi, rhsi) = left_tree[i]
-    # condition the structure of the
-    # right hand side subtree on the
-    # head of the left hand subtree
-
-    # if left hand subree has root 'comp'
-    # the right hand subtree is append
-    # with no root node'
-    if lhsi:
-        subtreei = compose_branching(lhsi, rhsi)
-        (_, lhsj, rhsj) = left_tree[j]
-        if lhsj:
-            subtreej = compose_branching(lhsj, rhsj)
+def treetostring(tree):
+    '''Bracketed string of a tree, built once per node.'''
+    if type(tree) == str:
+        return tree
+    if tree.bracketed is None:
+        rhs = treetostring(tree.rhs)
+        if tree.lhs == '':
+            tree.bracketed = '({} {})'.format(tree.root, rhs)
         else:
-            subtreej = rhsj
-    else:
-        subtreei = str(rhsi)
-        subtreej = treetostring(tree[j])
-    left_tree[i] = ('comp', subtreei, subtreej)
-    left_tree.pop(j)
-    return left_tree
+            tree.bracketed = '({} {} {})'.format(
+                tree.root, treetostring(tree.lhs), rhs)
+    return tree.bracketed
+
+
+# parentheses and the labels between them
+TREE_TOKEN_RE = re.compile(r'[()]|[^\s()]+')
+
+
+def string_to_tree(tree, table=None):
+    ''' Build the tree nodes of a bracketed tree string in
+        one pass, the inverse of "treetostring". A string
+        without brackets is returned unchanged.'''
+    if table is None:
+        table = {}
+    stack = [[]]
+    for token in TREE_TOKEN_RE.findall(tree):
+        if token == '(':
+            stack.append([])
+        elif token == ')':
+            if len(stack) == 1:
+                raise TreeGeneratorException(
+                    'Unbalanced tree: {}'.format(tree))
+            items = stack.pop()
+            if len(items) == 2:
+                node = make_node(items[0], '', items[1], table)
+            elif len(items) == 3:
+                node = make_node(items[0], items[1], items[2], table)
+            else:
+                raise TreeGeneratorException(
+                    'Not a binary tree: {}'.format(tree))
+            stack[-1].append(node)
+        else:
+            stack[-1].append(token)
+    if len(stack) != 1 or len(stack[0]) != 1:
+        raise TreeGeneratorException('Unbalanced tree: {}'.format(tree))
+    return stack[0][0]
 
 
-def compose_branching(lhs, rhs):
-    ''''''
-    lhs = treetostring(lhs)
-    rhs = treetostring(rhs)
-    if lhs:
-        subtree = '(comp {} {})'.format(str(lhs), str(rhs))
-    else:
-        subtree = str(rhs)
-    return subtree
-
-
-def right_append((i, j, tree)):
-    '''Tuple two subtrees of the list in "tree"
-       to generate a binary branching relation.
-
-         rooti      rootj
-           |          |
-       childreni    childrenj
-
-       The new root node is a comp node
-       that replaces the root node of
-       the right hand subtree indexed with
-       index j. The result looks like:
-
-               comp
-               /  \
-              /    \
-           rooti  childrenj
-            |
-        childreni
-
-       '''
-    subtreei = ""
-    subtreej = ""
-    right_tree = list(tree)
-    # append to the right
-    (_, lhsj, rhsj) = right_tree[j]
-    # condition the structure of the
-    # left hand side subtree on the
-    # head of the right hand subtree
-
-    # if right hand subree has root 'comp'
-    # the left hand subtree is append
-    # with no root node'
-    if lhsj:
-        (_, lhsi, rhsi) = right_tree[i]
-        if rhsi:
-            subtreei = compose_branching(lhsi, rhsi)
+# bracketing shapes by number of subtrees
+SHAPE_CACHE = {}
+# larger compounds are bracketed lazily from cached parts
+SHAPE_LIMIT = 8
+
+
+def bracketing_shapes(start, end):
+    ''' Enumerate every binary bracketing of the subtree
+        indices start, ..., end - 1 as nested (lhs, rhs) tuples.
+
+        Shapes are ordered by the size of the left hand side,
+        so the right branching shape comes first.
+    '''
+    if end - start == 1:
+        return [start]
+    shapes = []
+    for split in range(start + 1, end):
+        for lhs in bracketing_shapes(start, split):
+            for rhs in bracketing_shapes(split, end):
+                shapes.append((lhs, rhs))
+    return shapes
+
+
+def cached_shapes(num_subtrees):
+    ''' Return all distinct binary bracketing shapes
+        of "num_subtrees" subtrees.
+
+        The Catalan(n-1) shapes for n subtrees are
+        computed once and cached.
+    '''
+    if num_subtrees not in SHAPE_CACHE:
+        SHAPE_CACHE[num_subtrees] = bracketing_shapes(0, num_subtrees)
+    return SHAPE_CACHE[num_subtrees]
+
+
+def fill_shape(shape, subtrees, table):
+    '''Build the tree of a bracketing shape from the subtrees.'''
+    if type(shape) == int:
+        return subtrees[shape]
+    (lhs, rhs) = shape
+    return make_node(
+        'comp',
+        fill_shape(lhs, subtrees, table),
+        fill_shape(rhs, subtrees, table),
+        table)
+
+
+# number of bracketings by number of subtrees
+BRACKETING_COUNTS = [0, 1]
+
+
+def count_trees(num_subtrees):
+    ''' Number of distinct binary bracketings of "num_subtrees"
+        subtrees. Counted by dynamic programming over the split
+        point of the root, each side is bracketed independently.
+    '''
+    counts = BRACKETING_COUNTS
+    while len(counts) <= num_subtrees:
+        num = len(counts)
+        counts.append(sum(
+            counts[split] * counts[num - split]
+            for split in range(1, num)))
+    return counts[num_subtrees]
+
+
+def iter_bracketings(subtrees, table):
+    ''' Lazily yield every binary bracketing of "subtrees"
+        in the order of the cached bracketing shapes.'''
+    if len(subtrees) <= SHAPE_LIMIT:
+        for shape in cached_shapes(len(subtrees)):
+            yield fill_shape(shape, subtrees, table)
+        return
+    for split in range(1, len(subtrees)):
+        for lhs in iter_bracketings(subtrees[:split], table):
+            for rhs in iter_bracketings(subtrees[split:], table):
+                yield make_node('comp', lhs, rhs, table)
+
+
+def unrank_bracketing(subtrees, rank, table):
+    ''' Build the bracketing of "subtrees" at position "rank"
+        of "iter_bracketings" without enumerating the others.'''
+    if len(subtrees) == 1:
+        return subtrees[0]
+    for split in range(1, len(subtrees)):
+        rhs_count = count_trees(len(subtrees) - split)
+        split_count = count_trees(split) * rhs_count
+        if rank < split_count:
+            (lhs_rank, rhs_rank) = divmod(rank, rhs_count)
+            return make_node(
+                'comp',
+                unrank_bracketing(subtrees[:split], lhs_rank, table),
+                unrank_bracketing(subtrees[split:], rhs_rank, table),
+                table)
+        rank -= split_count
+    raise TreeGeneratorException('Bracketing rank out of range.')
+
+
+def sample_ranks(total, num_samples, rng):
+    ''' Draw "num_samples" distinct ranks below "total"
+        uniformly with the random generator "rng".'''
+    if num_samples >= total:
+        return range(total)
+    if 2 * num_samples > total:
+        return sorted(rng.sample(xrange(total), num_samples))
+    ranks = set()
+    while len(ranks) < num_samples:
+        ranks.add(rng.randrange(total))
+    return sorted(ranks)
+
+
+def sample_trees(in_list, num_samples, rng):
+    ''' Return "num_samples" distinct binary trees of the subtree
+        list drawn uniformly from all bracketings, in the order
+        of "iter_bracketings". All trees are returned if there
+        are not more. "rng" is a "random.Random" instance.'''
+    if not in_list:
+        print 'Error: tree contains zero elements.'
+        return []
+    table = {}
+    ranks = sample_ranks(count_trees(len(in_list)), num_samples, rng)
+    return [unrank_bracketing(in_list, rank, table) for rank in ranks]
+
+
+def right_branching_tree(subtrees, table):
+    '''Bracket the subtrees to the right.'''
+    tree = subtrees[-1]
+    for subtree in reversed(subtrees[:-1]):
+        tree = make_node('comp', subtree, tree, table)
+    return tree
+
+
+def iter_trees(in_list, max_trees=None, time_budget=None):
+    ''' Yield binary trees from subtree list one at a time.
+
+        Stop after "max_trees" trees or when "time_budget"
+        seconds are used up. The right branching tree is
+        yielded first, so even an exhausted budget leaves
+        a deterministic tree.
+    '''
+    if not in_list:
+        print 'Error: tree contains zero elements.'
+        return
+    # shared subtrees of all trees of the compound
+    table = {}
+    deadline = None
+    if time_budget is not None:
+        deadline = time.time() + time_budget
+    trees = iter_bracketings(in_list, table)
+    if max_trees:
+        trees = itertools.islice(trees, max_trees)
+    for (tree_idx, tree) in enumerate(trees):
+        if deadline is not None and time.time() > deadline:
+            if tree_idx == 0:
+                yield right_branching_tree(in_list, table)
+            return
+        yield tree
+
+
+# brackets of a tree string
+BRACKET_RE = re.compile(r'[()]')
+
+
+def subtree_end(tree, start):
+    '''End of the bracketed subtree starting at "start".'''
+    depth = 0
+    for match in BRACKET_RE.finditer(tree, start):
+        if match.group() == '(':
+            depth += 1
         else:
-            subtreei = rhsi
-        subtreej = compose_branching(lhsj, rhsj)
-    else:
-        subtreei = treetostring(tree[i])
-        subtreej = str(rhsj)
-    right_tree[i] = ('comp', tree[i], tree[j])
-    right_tree.pop(j)
-    return right_tree
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    raise TreeGeneratorException('Unbalanced tree: {}'.format(tree))
+
+
+def pack_trees(tree_list):
+    ''' Pack the tree strings of a compound into its forest
+        (number of trees, leaf subtree strings).
+
+        All trees of a compound bracket the same subtrees with
+        "comp" nodes, in the order of "iter_bracketings". The
+        first tree is right branching, so the subtrees are the
+        left children along its right spine.
+    '''
+    tree = tree_list[0]
+    leaves = []
+    pos = 0
+    while tree.startswith('(comp (', pos):
+        start = pos + len('(comp ')
+        end = subtree_end(tree, start)
+        leaves.append(tree[start:end])
+        # skip the separating blank
+        pos = end + 1
+    # every "comp" node on the spine closes after the last subtree
+    leaves.append(tree[pos:len(tree) - len(leaves)])
+    if len(tree_list) > count_trees(len(leaves)):
+        raise TreeGeneratorException(
+            'More trees than bracketings: {}'.format(tree))
+    return (len(tree_list), leaves)
+
+
+def unpack_trees(num_trees, leaves):
+    ''' Expand a forest (number of trees, leaf subtree strings)
+        back into the tree strings, the inverse of "pack_trees".'''
+    table = {}
+    return [
+        treetostring(tree) for tree in itertools.islice(
+            iter_bracketings(leaves, table), num_trees)]
 
 
 def build_trees(in_list):
-    ''' Build binary trees from subtree list.'''
-    tree_list = []
-    # initial tree
-    buff_list = [in_list]
-    while buff_list:
-        tree = buff_list.pop(0)
-        if len(tree) > 2:
-            copy_list = []
-            # copy list n times
-            # to generate a tree with
-            # every possible combination
-            # of a subtree tuple
-            # n = len(list)-1
-            for it in range(0, len(tree)-1):
-                copy_list.append(list(tree))
-            # zip list with a copy of the tree
-            # and the indices ot the subtrees
-            # to be tupled
-            ind_list = zip(
-                range(0, len(tree)-1), range(1, len(tree)), copy_list)
-            # build the tree with the new tuples
-            for ind_elem in ind_list:
-                buff_list.append(balanced_append(ind_elem))
-        elif len(tree) == 2:
-            buff_list.append(balanced_append((0, 1, tree)))
-        elif len(tree) == 1:
-            tree_list.append(treetostring(tree[0]))
-        else:
-            print 'Error: tree contains zero elements.'
-    return tree_list
+    ''' Build binary trees from subtree list by filling
+        the cached bracketing shapes with the subtrees.'''
+    return list(iter_trees(in_list))
 
 
-def make_root_tree(term_list, cat_dict=CAT_DICT):
-    ''''''
+def make_root_tree(term_list, table, cat_dict=CAT_DICT):
+    ''' Transform (base, word) terminals into
+        (root, '', (base, '', word)) trees.'''
     rooted_term_list = []
     for term in term_list:
         if term == '#':
             rooted_term_list.append(term)
         else:
-            (base, word) = term[1:-1].split()
+            (base, word) = term
             # simplification of link root node
             if base[0:4] == 'link':
                 root = 'link'
             else:
                 root = cat_dict.get(base, base)
-            rooted_term_list.append((root, '', (base, '', word)))
+            rooted_term_list.append(make_node(
+                root, '', make_node(base, '', word, table), table))
     return rooted_term_list
 
 
+def prepare_subtrees(result):
+    ''' Transform parser result:
+
+        [ (base, word) | '#' ]
+
+        to list of binary subtrees separated by "#".
+    '''
+    table = {}
+    term_list = make_root_tree(result, table)
+    # print 'Prepared base trees: %s' % str(term_list)
+    term_list = build_binary_subtrees(term_list, table)
+    # print 'Binary subtree list: {}'.format(term_list)
+    return term_list
+
+
 def generate(result):
     ''' Transform parser result:
 
-        [ 'parse tree']
+        [ (base, word) | '#' ]
+
+        to list of tree nodes:
 
         (parent, lhs, rhs)
 
+        Use "treetostring" to get the bracketed tree.
     '''
-    term_list = split_suffix_structures(result)
-    # print 'Compound parse result: %s' % str(term_list)
-    term_list = make_root_tree(term_list)
-    # print 'Prepared base trees: %s' % str(term_list)
-    term_list = build_binary_subtrees(term_list)
-    # print 'Binary subtree list: {}'.format(term_list)
+    term_list = prepare_subtrees(result)
     tree_list = build_trees(term_list)
     # print 'Compound tree list: {}'.format(term_list)
-    # remove duplicate trees
-    tree_list = list(set(tree_list))
     # for tree in tree_list:
         # print '\tTree: {}'.format(tree)
     return tree_list